@@ -0,0 +1,202 @@
+import copy, math
+import numpy as np
+
+from collections import namedtuple
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+# Default alarm limits in °C and % relative humidity, shared by the GUI and
+# the data server
+DEFAULT_LIMITS = {
+    "temp": {
+        "min": 10,
+        "max": 32
+    },
+    "rhum": {
+        "min": 20,
+        "max": 50
+    }
+}
+
+METRICS = ("temp", "rhum")
+
+def defaultLimits():
+    return copy.deepcopy(DEFAULT_LIMITS)
+
+LEVELS = {-1: "low", 0: "normal", 1: "high"}
+RATES = {-1: "falling", 0: "steady", 1: "rising"}
+
+# kind is "level" (against min/max) or "rate" (rate of change per minute)
+AlarmEvent = namedtuple("AlarmEvent", ["clientId", "metric", "kind", "state", "previous", "value", "timestamp"])
+
+def isValidReadout(readout):
+    '''
+    Returns whether readout is a dict with a finite numeric timestamp and
+    metric values, so it can be stored, evaluated and displayed.
+    '''
+    if not isinstance(readout, dict):
+        return False
+    for key in ("timestamp",) + METRICS:
+        value = readout.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            return False
+    return True
+
+def classifyReadout(readout, limits=DEFAULT_LIMITS):
+    '''
+    Returns {metric: "low" | "normal" | "high"} for a single readout using
+    plain limits without hysteresis.
+    '''
+    levels = {}
+    for metric in METRICS:
+        value = readout[metric]
+        if value > limits[metric]["max"]:
+            levels[metric] = "high"
+        elif value < limits[metric]["min"]:
+            levels[metric] = "low"
+        else:
+            levels[metric] = "normal"
+    return levels
+
+class AlarmEngine(object):
+    '''
+    Evaluates readouts against per-metric (and optionally per-clientId)
+    rules and notifies subscribers only when an alarm state changes.
+
+    Rules are read from the "alarms" config, e.g.:
+
+        {"temp": {"deadband": 0.5, "minDuration": 60, "maxRate": 2},
+         "clients": {"kitchen": {"temp": {"max": 35}}}}
+
+    min/max default to the limits passed in. deadband is how far a value
+    must move back inside a limit before the alarm clears, minDuration is
+    how many seconds a new state must persist before it is reported and
+    maxRate is the change per minute above which a metric is "rising" or
+    "falling". All values are in °C / %RH, matching the readouts.
+    '''
+
+    def __init__(self, limits=DEFAULT_LIMITS, config=None):
+        self.logger = Logger("AlarmEngine")
+        self.limits = limits
+        self.config = config or {}
+        self.subscribers = []
+        self.series = {}
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def ruleFor(self, clientId, metric):
+        rule = {"min": self.limits[metric]["min"], "max": self.limits[metric]["max"], "deadband": 0, "minDuration": 0, "maxRate": None}
+        rule.update(self.config.get(metric, {}))
+        rule.update(self.config.get("clients", {}).get(clientId, {}).get(metric, {}))
+        return rule
+
+    def stateFor(self, clientId, metric):
+        key = (clientId, metric)
+        if key not in self.series:
+            self.series[key] = {
+                "effective": None,   # Reported level code
+                "pending": None,     # Level code waiting out minDuration
+                "pendingSince": None,
+                "highOn": False,     # Hysteresis channel states
+                "lowOn": False,
+                "rate": 0,
+                "lastValue": None,
+                "lastTimestamp": None
+            }
+        return self.series[key]
+
+    def evaluate(self, readouts):
+        '''
+        Evaluates a batch of readout dicts and returns the resulting
+        state-change events after passing each one to the subscribers.
+        Alarm state follows the latest readout, so readouts at or before a
+        client's last evaluated timestamp (late or repeated) are skipped.
+        '''
+        byClient = {}
+        for readout in sorted(readouts, key=lambda readout: readout.get("timestamp", 0)):
+            byClient.setdefault(readout.get("clientId"), []).append(readout)
+
+        events = []
+        for clientId, clientReadouts in byClient.items():
+            last = self.stateFor(clientId, METRICS[0])["lastTimestamp"]
+            if last is not None:
+                clientReadouts = [r for r in clientReadouts if r.get("timestamp", 0) > last]
+            if not clientReadouts:
+                continue
+            timestamps = np.fromiter((r.get("timestamp", 0) for r in clientReadouts), dtype=float, count=len(clientReadouts))
+            for metric in METRICS:
+                values = np.fromiter((r[metric] for r in clientReadouts), dtype=float, count=len(clientReadouts))
+                rule = self.ruleFor(clientId, metric)
+                state = self.stateFor(clientId, metric)
+                events += self.__evaluateLevels(clientId, metric, rule, state, values, timestamps)
+                events += self.__evaluateRates(clientId, metric, rule, state, values, timestamps)
+                state["lastValue"] = values[-1]
+                state["lastTimestamp"] = timestamps[-1]
+
+        events.sort(key=lambda event: event.timestamp)
+        for event in events:
+            self.logger.info(chalk.white("Alarm state change") + self.logger.sep + chalk.blueBright(f"{event.clientId} {event.metric} {event.kind}: {event.previous} -> {event.state}"))
+            for callback in self.subscribers:
+                callback(event)
+        return events
+
+    def __hysteresis(self, onMask, offMask, initial):
+        # Vectorized latch: True where onMask, False where offMask, otherwise
+        # the previous value (carried forward from initial)
+        n = len(onMask)
+        decided = onMask | offMask
+        index = np.where(decided, np.arange(1, n + 1), 0)
+        np.maximum.accumulate(index, out=index)
+        latched = np.concatenate(([initial], onMask))
+        return latched[index]
+
+    def __evaluateLevels(self, clientId, metric, rule, state, values, timestamps):
+        deadband = rule["deadband"]
+        highOn = self.__hysteresis(values > rule["max"], values <= rule["max"] - deadband, state["highOn"])
+        lowOn = self.__hysteresis(values < rule["min"], values >= rule["min"] + deadband, state["lowOn"])
+        state["highOn"] = bool(highOn[-1])
+        state["lowOn"] = bool(lowOn[-1])
+        raw = np.where(highOn, 1, np.where(lowOn, -1, 0))
+
+        # Walk runs of identical raw state; a run only becomes the reported
+        # state once it has lasted minDuration seconds
+        events = []
+        boundaries = np.flatnonzero(np.diff(raw)) + 1
+        starts = np.concatenate(([0], boundaries))
+        ends = np.concatenate((boundaries, [len(raw)]))
+        for start, end in zip(starts, ends):
+            code = int(raw[start])
+            if code != state["pending"]:
+                state["pending"] = code
+                state["pendingSince"] = timestamps[start]
+            if code == state["effective"]:
+                continue
+            # The first state of a series is reported without waiting
+            minDuration = rule["minDuration"] if state["effective"] is not None else 0
+            i = start + int(np.searchsorted(timestamps[start:end], state["pendingSince"] + minDuration))
+            if i < end:
+                previous = LEVELS.get(state["effective"])
+                state["effective"] = code
+                events.append(AlarmEvent(clientId, metric, "level", LEVELS[code], previous, float(values[i]), float(timestamps[i])))
+        return events
+
+    def __evaluateRates(self, clientId, metric, rule, state, values, timestamps):
+        if rule["maxRate"] is None:
+            return []
+        if state["lastValue"] is None:
+            previousValues = np.concatenate(([values[0]], values[:-1]))
+            previousTimestamps = np.concatenate(([timestamps[0]], timestamps[:-1]))
+        else:
+            previousValues = np.concatenate(([state["lastValue"]], values[:-1]))
+            previousTimestamps = np.concatenate(([state["lastTimestamp"]], timestamps[:-1]))
+        elapsed = timestamps - previousTimestamps
+        with np.errstate(divide="ignore", invalid="ignore"):
+            perMinute = np.where(elapsed > 0, (values - previousValues) / elapsed * 60, 0)
+        codes = np.where(perMinute > rule["maxRate"], 1, np.where(perMinute < -rule["maxRate"], -1, 0))
+        changed = np.flatnonzero(codes != np.concatenate(([state["rate"]], codes[:-1])))
+        events = []
+        for i in changed:
+            events.append(AlarmEvent(clientId, metric, "rate", RATES[int(codes[i])], RATES[int(codes[i - 1])] if i > 0 else RATES[state["rate"]], float(values[i]), float(timestamps[i])))
+        state["rate"] = int(codes[-1])
+        return events
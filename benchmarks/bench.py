@@ -0,0 +1,182 @@
+'''
+Micro-benchmarks for the display and publishing hot paths.
+
+History-dependent cases run at several history sizes. Results are stored
+as JSON; compare flags cases that got slower than the stored baseline.
+Run from the repository root:
+
+    python -m benchmarks.bench run --output results.json
+    python -m benchmarks.bench compare results.json
+    python -m benchmarks.bench compare            # runs the suite first
+    python -m benchmarks.bench run --output benchmarks/baseline.json   # refresh the baseline
+
+Baselines are machine-specific; refresh it on the hardware you compare on.
+'''
+import argparse, base64, gc, json, logging, os, platform, sys, timeit
+
+from collections import deque
+
+from benchmarks.render import syntheticReadouts
+
+DEFAULT_SIZES = (48, 10000, 1000000)
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+class FakeMessageInfo(object):
+    def __init__(self, mid):
+        self.mid = mid
+
+class FakePahoClient(object):
+    # Stands in for paho.mqtt.client.Client so Broadcaster.send runs without a broker
+    def __init__(self):
+        self.mid = 0
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        self.mid += 1
+        return FakeMessageInfo(self.mid)
+
+class FakeSQSClient(object):
+    # Returns the same base64 message on every receive
+    def __init__(self, readout):
+        self.message = {
+            "Body": base64.b64encode(json.dumps(readout).encode()).decode(),
+            "ReceiptHandle": "benchmark"
+        }
+
+    def receive_message(self, **kwargs):
+        return {"Messages": [self.message]}
+
+    def delete_message(self, **kwargs):
+        pass
+
+def measure(fn, repeat=5):
+    '''
+    Returns the best per-call time in seconds over repeat timeit runs,
+    after an untimed warm-up run.
+    '''
+    gc.collect()
+    timer = timeit.Timer(fn)
+    # The warm-up fills caches and settles lazily created state; it also sizes the runs
+    number, elapsed = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+def windowCases(window, size):
+    window.updateLabels()
+    yield f"SensorDisplay.mapReadouts[{size}]", lambda: window.mapReadouts(window.limits['n']['graph'])
+    yield f"SensorDisplay.getMinMaxAvg[{size}]", window.getMinMaxAvg
+    yield f"SensorDisplay.graphData[{size}]", window.graphData
+    yield f"SensorDisplay.updateLabels[{size}]", window.updateLabels
+
+def displayCases(sizes):
+    from gui import SensorDisplay, createApplication
+    app = createApplication(headless=True)
+    readouts = list(syntheticReadouts(max(sizes)))
+    # One window per history size, so rounds can revisit every case
+    for size in sizes:
+        window = SensorDisplay(headless=True, source=lambda: None)
+        window.data['history'] = deque(readouts[-size:], maxlen=size)
+        yield from windowCases(window, size)
+        app.processEvents()
+
+def pipelineCases():
+    from broadcaster import Broadcaster
+    from sensor import AHT20Sensor
+    from sqsHandler import SQSHandler
+    from utils.convert import convertTemperature
+
+    yield "convertTemperature", lambda: convertTemperature(21.5, "F")
+
+    sensor = AHT20Sensor()
+    yield "AHT20Sensor.getReadout", sensor.getReadout
+
+    readout = json.loads(next(syntheticReadouts(1)))
+    handler = SQSHandler()
+    handler.sqs = FakeSQSClient(readout)
+    yield "SQSHandler.getMessage", lambda: json.loads(handler.getMessage())
+
+    broadcaster = Broadcaster(listener=False, topic="aht20sensor")
+    broadcaster.mqttc = FakePahoClient()
+    broadcaster.is_connected = True
+    yield "Broadcaster.send", lambda: broadcaster.send(readout)
+
+def run(sizes=DEFAULT_SIZES, rounds=3):
+    '''
+    Measures every case once per round and keeps its best time. Rounds go
+    through the whole suite in turn, so a burst of load on the machine
+    only spoils one round of a case rather than all of its samples.
+    '''
+    logging.disable(logging.CRITICAL)
+    results = {}
+    try:
+        cases = list(pipelineCases()) + list(displayCases(sizes))
+        for round in range(rounds):
+            for name, fn in cases:
+                results[name] = min(results.get(name, float("inf")), measure(fn))
+        for name, seconds in results.items():
+            print(f"{name:<40} {seconds * 1e6:>14.2f} us", file=sys.stderr)
+    finally:
+        logging.disable(logging.NOTSET)
+    return {
+        "machine": f"{platform.system()} {platform.machine()} / Python {platform.python_version()}",
+        "results": results
+    }
+
+def compare(current, baseline, threshold=0.4):
+    '''
+    Prints current vs baseline timings and returns the names of cases that
+    are more than threshold (fractional) slower.
+    '''
+    regressions = []
+    print(f"{'case':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, seconds in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>12} {seconds * 1e6:>10.2f}us {'new':>9}")
+            continue
+        change = seconds / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} {before * 1e6:>10.2f}us {seconds * 1e6:>10.2f}us {change:>+8.1%}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or compare hot-path micro-benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    runParser = subparsers.add_parser("run", help="run the suite")
+    runParser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="history sizes for display cases")
+    runParser.add_argument("--rounds", type=int, default=3, help="passes over the suite; each case keeps its best time")
+    runParser.add_argument("--output", help="write results JSON here")
+    compareParser = subparsers.add_parser("compare", help="compare results with the baseline")
+    compareParser.add_argument("results", nargs="?", help="results JSON (runs the suite when omitted)")
+    compareParser.add_argument("--baseline", default=BASELINE)
+    compareParser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    compareParser.add_argument("--rounds", type=int, default=3)
+    compareParser.add_argument("--threshold", type=float, default=0.4, help="fractional slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.sizes, args.rounds)
+        if args.output:
+            with open(args.output, "w") as out:
+                json.dump(results, out, indent=2)
+        else:
+            print(json.dumps(results, indent=2))
+    else:
+        if args.results:
+            with open(args.results) as results:
+                current = json.load(results)
+        else:
+            current = run(args.sizes, args.rounds)
+        with open(args.baseline) as baseline:
+            regressions = compare(current, json.load(baseline), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions.")
@@ -0,0 +1,129 @@
+'''
+End-to-end check of SQS consumer pool delivery into SensorDisplay.
+
+Feeds shuffled readouts from a fake queue through a ConsumerPool into a
+headless SensorDisplay whose history store and alarm engine each fail
+once. The queue also holds a few invalid messages. Passes when every
+valid readout is stored, evaluated and shown in timestamp order and
+every message is deleted, valid ones only after they were applied. Run from the repository root:
+
+    python -m benchmarks.delivery --messages 500 --receivers 8
+'''
+import argparse, base64, json, logging, os, random, sys, tempfile, threading, time
+
+from benchmarks.render import syntheticReadouts
+from gui import SensorDisplay, createApplication
+from historyStore import HistoryStore
+from sqsHandler import ConsumerPool, SQSHandler
+
+class FakeQueue(object):
+    # In-memory stand-in for the SQS calls ConsumerPool makes
+    def __init__(self, bodies):
+        self.lock = threading.Lock()
+        self.visible = {f"receipt-{i}": body for i, body in enumerate(bodies)}
+        self.inFlight = {}
+        self.deleted = set()
+        self.released = set()
+        self.receives = {}
+
+    def receive_message(self, **kwargs):
+        time.sleep(0.02)
+        with self.lock:
+            receipts = list(self.visible)[:kwargs["MaxNumberOfMessages"]]
+            for receipt in receipts:
+                self.inFlight[receipt] = self.visible.pop(receipt)
+                self.receives[receipt] = self.receives.get(receipt, 0) + 1
+            return {"Messages": [{
+                "Body": self.inFlight[receipt],
+                "ReceiptHandle": receipt,
+                "Attributes": {"ApproximateReceiveCount": str(self.receives[receipt])}
+            } for receipt in receipts]}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        with self.lock:
+            for entry in Entries:
+                self.inFlight.pop(entry["ReceiptHandle"])
+                self.deleted.add(entry["ReceiptHandle"])
+        return {"Successful": Entries}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        with self.lock:
+            for entry in Entries:
+                if entry["VisibilityTimeout"] == 0:
+                    self.released.add(entry["ReceiptHandle"])
+                    self.visible[entry["ReceiptHandle"]] = self.inFlight.pop(entry["ReceiptHandle"])
+
+class FlakyHistoryStore(HistoryStore):
+    # Fails the first append, like a locked or full database would
+    def __init__(self, path):
+        super(FlakyHistoryStore, self).__init__(path)
+        self.failed = False
+
+    def append(self, readouts):
+        if not self.failed:
+            self.failed = True
+            raise OSError("simulated history store failure")
+        super(FlakyHistoryStore, self).append(readouts)
+
+def failOnce(fn, seen):
+    # Wraps fn so its first call fails; later calls record the readouts they were given
+    calls = []
+    def wrapper(readouts):
+        calls.append(len(readouts))
+        if len(calls) == 1:
+            raise RuntimeError(f"simulated {fn.__name__} failure")
+        seen.update(readout['timestamp'] for readout in readouts)
+        return fn(readouts)
+    return wrapper
+
+def run(messages, receivers, timeout):
+    app = createApplication(headless=True)
+    logging.disable(logging.CRITICAL)
+    readouts = [json.loads(readout) for readout in syntheticReadouts(messages, start=0)]
+    # A JSON scalar and a readout without temp must be dropped, not stall the pool
+    invalid = [5, {"clientId": "benchmark", "timestamp": -1, "rhum": 40}]
+    bodies = [base64.b64encode(json.dumps(readout).encode()).decode() for readout in readouts + invalid]
+    random.shuffle(bodies)
+    queue = FakeQueue(bodies)
+
+    window = SensorDisplay(headless=True, source=lambda: None)
+    database = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    window.historyStore = FlakyHistoryStore(database)
+    evaluated = set()
+    window.alarms.evaluate = failOnce(window.alarms.evaluate, evaluated)
+    window.consumerPool = ConsumerPool(SQSHandler(client=queue), window.deliveryReceived.emit, receivers=receivers, mergeWindow=0.1, waitSeconds=0).start()
+
+    deadline = time.monotonic() + timeout
+    while len(queue.deleted) < len(bodies) and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    window.consumerPool.stop()
+    logging.disable(logging.NOTSET)
+
+    stored = [row[0] for chunk in window.historyStore.iterChunks() for row in chunk]
+    shown = [json.loads(entry)['timestamp'] for entry in window.data['history']]
+    expected = sorted(readout['timestamp'] for readout in readouts)
+    checks = [
+        ("a message was released after the failed apply", len(queue.released) > 0),
+        ("every message was deleted, invalid ones included", len(queue.deleted) == len(bodies)),
+        ("every readout was stored", stored == expected),
+        ("every readout reached the alarm engine", sorted(evaluated) == expected),
+        ("the history is in timestamp order", shown == sorted(shown) and shown == expected[-len(shown):])
+    ]
+    return checks, len(queue.released)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check consumer pool delivery end to end.")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--receivers", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the queue to drain")
+    args = parser.parse_args()
+
+    checks, released = run(args.messages, args.receivers, args.timeout)
+    for description, passed in checks:
+        print(f"  {'ok  ' if passed else 'FAIL'} {description}")
+    print(f"{released} message(s) released and redelivered.")
+    if not all(passed for description, passed in checks):
+        print("Delivery check failed.")
+        sys.exit(1)
+    print("Delivery check passed.")
@@ -0,0 +1,89 @@
+'''
+Render-throughput benchmark for SensorDisplay.
+
+Replays N synthetic readouts through a headless SensorDisplay on the
+offscreen Qt platform and reports readouts/sec, per-stage time and RSS
+growth. Run from the repository root:
+
+    python -m benchmarks.render 500
+'''
+import argparse, json, logging, random, time
+
+from gui import SensorDisplay, createApplication
+from utils.metrics import registry
+from utils.profiling import currentRss
+
+def syntheticReadouts(n, clientId="benchmark", seed=0, start=None):
+    '''
+    Yields n JSON-encoded readouts shaped like the ones dataServer publishes.
+    '''
+    rng = random.Random(seed)
+    timestamp = time.time() if start is None else start
+    temp, rhum = 21.0, 40.0
+    for i in range(n):
+        temp = min(max(temp + rng.uniform(-1.5, 1.5), -30), 45)
+        rhum = min(max(rhum + rng.uniform(-3, 3), 0), 100)
+        yield json.dumps({
+            "temp": temp,
+            "rhum": rhum,
+            "timestamp": timestamp + i * 60,
+            "clientId": clientId
+        })
+
+def stageTotals():
+    names = ["gui_update_seconds", "gui_stats_seconds", "gui_graph_seconds"]
+    return {name: registry.histogram(name).sum for name in names}
+
+def run(n, verbose=False):
+    app = createApplication(headless=True)
+    if not verbose:
+        logging.disable(logging.INFO)
+    window = SensorDisplay(headless=True, source=lambda: None)
+
+    before = stageTotals()
+    rssStart = currentRss()
+    start = time.perf_counter()
+    for readout in syntheticReadouts(n):
+        window.receiveReadout(readout)
+        app.processEvents()
+    elapsed = time.perf_counter() - start
+    rssEnd = currentRss()
+    after = stageTotals()
+    logging.disable(logging.NOTSET)
+
+    update = after["gui_update_seconds"] - before["gui_update_seconds"]
+    stats = after["gui_stats_seconds"] - before["gui_stats_seconds"]
+    graph = after["gui_graph_seconds"] - before["gui_graph_seconds"]
+    window.close()
+    return {
+        "readouts": n,
+        "seconds": elapsed,
+        "readoutsPerSecond": n / elapsed if elapsed else 0,
+        "stageSeconds": {
+            "labels": update - stats - graph,
+            "getMinMaxAvg": stats,
+            "graphData": graph
+        },
+        "rssStartBytes": rssStart,
+        "rssGrowthBytes": rssEnd - rssStart
+    }
+
+def report(result):
+    print(f"Readouts replayed : {result['readouts']}")
+    print(f"Elapsed           : {result['seconds']:.3f}s ({result['readoutsPerSecond']:.1f} readouts/sec)")
+    for stage, seconds in result["stageSeconds"].items():
+        perReadout = seconds / result["readouts"] * 1000 if result["readouts"] else 0
+        print(f"  {stage:<16}: {seconds:.3f}s total, {perReadout:.3f}ms/readout")
+    print(f"RSS growth        : {result['rssGrowthBytes'] / 1048576:.1f} MiB (from {result['rssStartBytes'] / 1048576:.1f} MiB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay synthetic readouts through a headless SensorDisplay.")
+    parser.add_argument("n", type=int, nargs="?", default=200, help="number of readouts to replay")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep SensorDisplay logging enabled")
+    args = parser.parse_args()
+    result = run(args.n, verbose=args.verbose)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        report(result)
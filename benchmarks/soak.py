@@ -0,0 +1,121 @@
+'''
+Soak test for memory and widget leaks in SensorDisplay.
+
+Drives a headless SensorDisplay with synthetic readouts as fast as it can
+render them, sampling RSS, Python object counts, live QObject/QWidget
+counts and per-update latency. Fails when any of them keeps growing
+faster than its slope threshold once warmed up. Run from the repository
+root:
+
+    python -m benchmarks.soak --readouts 2000000 --batch 100
+'''
+import argparse, gc, json, logging, sys, time, tracemalloc
+import numpy as np
+
+from collections import Counter
+from PyQt5.QtCore import QObject
+from PyQt5.QtWidgets import QApplication
+
+from benchmarks.render import syntheticReadouts
+from gui import SensorDisplay, createApplication
+from utils.profiling import currentRss
+
+def objectCounts():
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+def sample(window, readouts, latencies, traced):
+    gc.collect()
+    return {
+        "readouts": readouts,
+        "rssBytes": currentRss(),
+        "pythonObjects": len(gc.get_objects()),
+        "tracedBytes": tracemalloc.get_traced_memory()[0] if traced else None,
+        "qobjects": len(window.findChildren(QObject)),
+        "qwidgets": len(QApplication.allWidgets()),
+        "updateMs": float(np.mean(latencies)) * 1000 if latencies else None
+    }
+
+def slope(samples, key, per=10000):
+    # Least-squares growth of key per `per` readouts
+    points = [(s["readouts"], s[key]) for s in samples if s[key] is not None]
+    if len(points) < 2:
+        return 0
+    x, y = zip(*points)
+    return float(np.polyfit(x, y, 1)[0]) * per
+
+def run(readouts, batch, sampleEvery, useTracemalloc):
+    app = createApplication(headless=True)
+    logging.disable(logging.CRITICAL)
+    if useTracemalloc:
+        tracemalloc.start()
+    window = SensorDisplay(headless=True, source=lambda: None)
+
+    samples = []
+    latencies = []
+    firstCounts = None
+    pending = []
+    fed = 0
+    for readout in syntheticReadouts(readouts, start=0):
+        pending.append(json.loads(readout))
+        if len(pending) < batch:
+            continue
+        start = time.perf_counter()
+        window.receiveReadout(pending)
+        app.processEvents()
+        latencies.append(time.perf_counter() - start)
+        fed += len(pending)
+        pending = []
+        if fed % sampleEvery < batch:
+            samples.append(sample(window, fed, latencies, useTracemalloc))
+            latencies = []
+            if firstCounts is None:
+                firstCounts = objectCounts()
+            last = samples[-1]
+            print(f"{fed:>10} readouts  rss={last['rssBytes'] / 1048576:8.1f}MiB  objects={last['pythonObjects']:>9}  qobjects={last['qobjects']:>5}  qwidgets={last['qwidgets']:>4}  update={last['updateMs']:.2f}ms", file=sys.stderr)
+
+    lastCounts = objectCounts()
+    logging.disable(logging.NOTSET)
+    growth = (lastCounts - firstCounts).most_common(10) if firstCounts is not None else []
+    return samples, growth
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Soak-test SensorDisplay for leaks.")
+    parser.add_argument("--readouts", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=100, help="readouts delivered per update")
+    parser.add_argument("--sample-every", type=int, default=50000, help="readouts between samples")
+    parser.add_argument("--warmup", type=float, default=0.2, help="fraction of samples ignored when fitting slopes")
+    parser.add_argument("--tracemalloc", action="store_true", help="also track traced Python memory (slower)")
+    parser.add_argument("--max-rss-slope", type=float, default=256 * 1024, help="allowed RSS growth in bytes per 10k readouts")
+    parser.add_argument("--max-object-slope", type=float, default=100, help="allowed Python object growth per 10k readouts")
+    parser.add_argument("--max-qobject-slope", type=float, default=0.5, help="allowed QObject/QWidget growth per 10k readouts")
+    parser.add_argument("--max-latency-slope", type=float, default=0.5, help="allowed update latency growth in ms per 10k readouts")
+    parser.add_argument("--output", help="write samples as JSON here")
+    args = parser.parse_args()
+
+    samples, growth = run(args.readouts, args.batch, args.sample_every, args.tracemalloc)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(samples, out, indent=2)
+
+    steady = samples[int(len(samples) * args.warmup):]
+    checks = [
+        ("rssBytes", args.max_rss_slope),
+        ("tracedBytes", args.max_rss_slope),
+        ("pythonObjects", args.max_object_slope),
+        ("qobjects", args.max_qobject_slope),
+        ("qwidgets", args.max_qobject_slope),
+        ("updateMs", args.max_latency_slope)
+    ]
+    failures = []
+    print("Growth per 10k readouts after warmup:")
+    for key, limit in checks:
+        growthRate = slope(steady, key)
+        failed = growthRate > limit
+        if failed:
+            failures.append(key)
+        print(f"  {key:<14} {growthRate:>14.2f}  (limit {limit:g}){'  FAIL' if failed else ''}")
+    print("Largest object type growth:", ", ".join(f"{name} +{count}" for name, count in growth) or "none")
+    if failures:
+        print(f"Soak test failed: {', '.join(failures)} kept growing.")
+        sys.exit(1)
+    print("Soak test passed.")
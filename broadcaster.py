@@ -1,31 +1,50 @@
-import json
+import json, threading
 import paho.mqtt.client as paho
 
+from recorder import record
 from utils.custom_logging import Logger
+from utils.metrics import registry
 from simple_chalk import blue, blueBright, greenBright, magenta, magentaBright, white, whiteBright, yellowBright
-from time import sleep
+from collections import deque
+from time import monotonic, perf_counter, sleep
 
 file = open("./data/device.json")
 device = json.load(file)
 file.close()
 
+publishAttempts = registry.counter("mqtt_publish_attempts_total", "MQTT publishes attempted")
+publishAcked = registry.counter("mqtt_publish_acked_total", "MQTT publishes acknowledged by the broker")
+publishSeconds = registry.histogram("mqtt_publish_seconds", "Time spent in Broadcaster.send, including waiting for a connection")
+publishAckSeconds = registry.histogram("mqtt_publish_ack_seconds", "Time from publish to broker acknowledgement")
+alarmsPublished = registry.counter("mqtt_alarms_published_total", "Alarm readouts published on the alarm topic")
+routineBatches = registry.counter("mqtt_routine_batches_published_total", "Coalesced routine batches published")
+routineDropped = registry.counter("mqtt_routine_dropped_total", "Routine readouts dropped because the send queue was full")
+sendQueueDepth = registry.gauge("mqtt_send_queue_depth", "Readouts waiting in the priority send queue")
+messagesReceived = registry.counter("mqtt_messages_received_total", "MQTT messages received on subscribed topics")
+
 # Refactored original source - https://gist.github.com/skirdey/9cdead881799a47742ff3cd296d06cc1
 # Reference: https://aws.amazon.com/blogs/iot/use-aws-iot-core-mqtt-broker-with-standard-mqtt-libraries/
 
 class Broadcaster(object):
 
-    def __init__(self, listener = False, topic = "default"):
+    def __init__(self, listener = False, topic = "default", onMessage = None):
         self.logger = Logger("Broadcaster")   
         self.is_connected = False
         self.listener = listener
+        self.onMessage = onMessage  # Called with each received payload when listening
         self.topic = f"{device['thingName']}/{topic}"
+        # A listener needs its own client id, or the broker drops the publisher's session
+        self.clientId = f"{device['clientId']}-listener" if listener else device["clientId"]
+        self.publishTimes = {}
+        self.persistent = False     # Keep the network loop running between publishes
+        self.publisher = None
 
     def __on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == "Success":
             self.logger.info(f"{magenta('Connected to endpoint')} {blueBright(device['awshost'])} {magenta('with result code')} {blueBright(rc)}")
             self.is_connected = True
             if self.listener == True:
-                self.mqttc.subscribe(self.topic)
+                self.mqttc.subscribe(self.topic, qos=1)
         else:
             self.logger.warn(f"There was a problem establishing a connection. Result code: {yellowBright(rc)}")
 
@@ -40,6 +59,7 @@ class Broadcaster(object):
         self.logger.debug(f"__on_disconnect disconnect_flags: {disconnect_flags}")
         self.logger.debug(f"__on_disconnect properties: {properties}")
         self.logger.info(f"__on_disconnect rc: {rc}")
+        self.is_connected = False
 
     def __on_log(self, client, userdata, level, buf):
         self.logger.debug(f"__on_log client: {client}")
@@ -52,6 +72,10 @@ class Broadcaster(object):
         self.logger.debug(f"__on_message userdata: {userdata}")
         self.logger.info("__on_message (Topic)" + blueBright(self.logger.sep) + whiteBright(msg.topic))
         self.logger.info("__on_message (Payload)" + blueBright(self.logger.sep) + whiteBright(msg.payload))
+        messagesReceived.inc()
+        record("mqtt-in", msg.payload)
+        if self.onMessage is not None:
+            self.onMessage(msg.payload)
 
     def __on_preconnect(self, client, userdata):
         self.logger.debug(f"__on_subscribe client: {client}")
@@ -63,7 +87,12 @@ class Broadcaster(object):
         self.logger.debug(f"__on_publish mid: {mid}")
         self.logger.debug(f"__on_publish properties: {properties}")
         self.logger.info(f"__on_publish rc: {rc}")
-        self.mqttc.loop_stop()
+        publishAcked.inc()
+        sentAt = self.publishTimes.pop(mid, None)
+        if sentAt is not None:
+            publishAckSeconds.observe(perf_counter() - sentAt)
+        if not self.persistent:
+            self.mqttc.loop_stop()
     
     def __on_subscribe(self, client, userdata, mid, reason_code_list, properties=None):
         self.logger.debug(f"__on_subscribe client: {client}")
@@ -82,7 +111,7 @@ class Broadcaster(object):
     def broker_connect(self):
         self.logger.info(blue("Initializing paho MQTT Client Broker..."))
         self.mqttc = paho.Client(
-            client_id=device["clientId"],
+            client_id=self.clientId,
             callback_api_version=paho.CallbackAPIVersion.VERSION2,
             protocol=5
         )
@@ -113,6 +142,11 @@ class Broadcaster(object):
 
         return self
     
+    def listen(self):
+        # Runs the network loop in the background; subscription happens in __on_connect
+        self.mqttc.loop_start()
+        return self
+
     def broker_disconnect(self):
         self.logger.debug("broker_disconnect called.")
         self.logger.info("Disconnecting broker.")
@@ -122,6 +156,7 @@ class Broadcaster(object):
         return self
 
     def send(self, data):
+        start = perf_counter()
         self.mqttc.loop_start()
         cnxString = f'{magenta("Waiting for connection")}{whiteBright("...")}'
         while self.is_connected == False:
@@ -129,6 +164,83 @@ class Broadcaster(object):
             cnxString += magentaBright(".")
             sleep(0.25)
         
-        self.mqttc.publish(self.topic, json.dumps(data), qos=1)
+        publishAttempts.inc()
+        record("mqtt", data)
+        info = self.mqttc.publish(self.topic, json.dumps(data), qos=1)
+        self.publishTimes[info.mid] = perf_counter()
+        publishSeconds.observe(perf_counter() - start)
         self.logger.info("MQTT" + whiteBright(self.logger.sep) + blue("Data sent: ") + whiteBright("{0}".format(data)))
-        
\ No newline at end of file
+
+    def startPublisher(self, batchSize=10, batchInterval=60, routineQos=0, maxQueue=1000):
+        '''
+        Starts the priority-aware publish path used by publish(). Alarm
+        readouts go out immediately at QoS 1 on {topic}/alarm; routine
+        readouts are coalesced into batches of up to batchSize (or whatever
+        is queued after batchInterval seconds) and sent at routineQos on the
+        normal topic. Alarms are always drained first, so routine readouts
+        older than an alarm can arrive after it; subscribers must accept
+        late readouts. The routine queue drops its oldest readouts once
+        maxQueue are waiting.
+        '''
+        self.alarmTopic = f"{self.topic}/alarm"
+        self.batchSize = int(batchSize)
+        self.batchInterval = float(batchInterval)
+        self.routineQos = int(routineQos)
+        self.alarmQueue = deque()
+        self.routineQueue = deque(maxlen=int(maxQueue))
+        self.firstRoutineAt = None
+        self.queueCondition = threading.Condition()
+        self.persistent = True
+        self.mqttc.loop_start()
+        self.publisher = threading.Thread(target=self.__drainQueue, daemon=True)
+        self.publisher.start()
+        self.logger.info(blue("Priority publisher started") + whiteBright(self.logger.sep) + white(f"alarms on {self.alarmTopic}, routine batches of {self.batchSize} every {self.batchInterval:g}s"))
+        return self
+
+    def publish(self, data, alarm=False):
+        with self.queueCondition:
+            if alarm:
+                self.alarmQueue.append(data)
+            else:
+                if len(self.routineQueue) == self.routineQueue.maxlen:
+                    routineDropped.inc()
+                if not self.routineQueue:
+                    self.firstRoutineAt = monotonic()
+                self.routineQueue.append(data)
+            sendQueueDepth.set(len(self.alarmQueue) + len(self.routineQueue))
+            self.queueCondition.notify()
+
+    def __nextItem(self):
+        # Called with queueCondition held; blocks until something is due
+        while True:
+            timeout = None
+            if not self.is_connected:
+                timeout = 0.25
+            elif self.alarmQueue:
+                return True, self.alarmQueue.popleft()
+            elif self.routineQueue:
+                waited = monotonic() - self.firstRoutineAt
+                if len(self.routineQueue) >= self.batchSize or waited >= self.batchInterval:
+                    batch = [self.routineQueue.popleft() for i in range(min(self.batchSize, len(self.routineQueue)))]
+                    self.firstRoutineAt = monotonic() if self.routineQueue else None
+                    return False, batch
+                timeout = self.batchInterval - waited
+            self.queueCondition.wait(timeout)
+
+    def __drainQueue(self):
+        while True:
+            with self.queueCondition:
+                alarm, item = self.__nextItem()
+                sendQueueDepth.set(len(self.alarmQueue) + len(self.routineQueue))
+            publishAttempts.inc()
+            record("mqtt-alarm" if alarm else "mqtt", item)
+            if alarm:
+                info = self.mqttc.publish(self.alarmTopic, json.dumps(item), qos=1)
+                alarmsPublished.inc()
+                self.logger.info("MQTT" + whiteBright(self.logger.sep) + yellowBright("Alarm sent: ") + whiteBright("{0}".format(item)))
+            else:
+                payload = item[0] if len(item) == 1 else item
+                info = self.mqttc.publish(self.topic, json.dumps(payload), qos=self.routineQos)
+                routineBatches.inc()
+                self.logger.info("MQTT" + whiteBright(self.logger.sep) + blue(f"Batch of {len(item)} sent"))
+            self.publishTimes[info.mid] = perf_counter()
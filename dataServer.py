@@ -1,14 +1,23 @@
 import datetime, json, sys
+from alarms import AlarmEngine, METRICS, classifyReadout
 from broadcaster import Broadcaster
+from localBridge import LocalBridgeSender
+from sampling import AdaptiveSampler
 from sensor import AHT20Sensor
 from simple_chalk import chalk
 from time import sleep
 from utils.custom_logging import Logger
+from utils.metrics import registry, startMetrics
+from utils.profiling import profiled, startProfiling
 
 file = open("./data/device.json")
 device = json.load(file)
 file.close()
 
+readoutsTotal = registry.counter("sensor_readouts_total", "Sensor readouts taken")
+readoutSeconds = registry.histogram("sensor_readout_seconds", "Time spent reading the sensor")
+readoutsSuppressed = registry.counter("sensor_readouts_suppressed_total", "Readouts not published because they were within the deadband")
+
 class SensorData():
 
     def __init__(self, interval, *args, **kwargs):
@@ -18,30 +27,79 @@ class SensorData():
         self.sensor = AHT20Sensor()
         self.clientId = device["clientId"]
         self.broadcaster = Broadcaster(listener=False, topic ="aht20sensor")
+        # Same-host GUIs get readouts over a local socket; cloud publishing continues
+        self.localBridge = LocalBridgeSender() if device.get("localBridge", False) else None
 
         # Init Vars
         self.currentTemperature = 0 # °C by default
         self.currentHumidity = 0    # % relative Humidity
         self.n = int(interval)      # Number of ms between sensor readings
+        self.interval = self.n      # Effective interval, adjusted by the adaptive sampler
+
+        # Alarm thresholds, matching the ones the GUI evaluates
+        self.alarms = AlarmEngine(config=device.get("alarms"))
+        self.limits = {metric: self.alarms.ruleFor(self.clientId, metric) for metric in METRICS}
+        samplingConfig = device.get("adaptiveSampling")
+        self.sampler = AdaptiveSampler(self.n, samplingConfig, self.limits) if samplingConfig else None
+
+        # Priority publishing: alarms go out at once, routine readouts are batched,
+        # e.g. {"batchSize": 10, "batchInterval": 60, "routineQos": 0, "maxQueue": 1000}
+        self.priorityPublishing = device.get("priorityPublishing")
 
+        # Report-by-exception: when configured, only publish readouts that
+        # move beyond a deadband from the last published readout, plus a
+        # heartbeat every "heartbeat" seconds, e.g.
+        # {"temp": {"absolute": 0.5}, "rhum": {"relative": 0.02}, "heartbeat": 900}
+        self.reportByException = device.get("reportByException")
+        self.lastPublished = None
+        self.suppressed = 0         # Readouts suppressed since the last publish
+
+    @profiled("SensorData.startSensing")
     def startSensing(self):
         self.logger.debug("startSensing called")
         while True:
             self.getReadout()
-            sleep(self.n)
+            sleep(self.interval)
 
     def getReadout(self):
-        h,t = self.sensor.getReadout()
+        with readoutSeconds.time():
+            h,t = self.sensor.getReadout()
+        readoutsTotal.inc()
         currentTime = datetime.datetime.now()
         readout = {
             "temp": t,
             "rhum": h,
             "timestamp": currentTime.timestamp(),
-            "clientId": self.clientId
+            "clientId": self.clientId,
+            "interval": self.interval
         }
         self.logger.info(f"New sensor readout • {chalk.blueBright(readout)}")
-        
-        if self.broadcaster.is_connected == False:
+
+        if self.sampler is not None:
+            self.interval = self.sampler.nextInterval(readout)
+
+        # Readings outside the alarm limits are always published
+        alarm = any(level != "normal" for level in classifyReadout(readout, self.limits).values())
+        reason = "alarm" if alarm else self.publishReason(readout)
+        if reason is None:
+            self.suppressed += 1
+            readoutsSuppressed.inc()
+            self.logger.info(chalk.white("Readout within deadband; not publishing.") + self.logger.sep + chalk.blueBright(f"{self.suppressed} suppressed"))
+            return readout
+        readout["suppressed"] = self.suppressed
+        if reason == "heartbeat":
+            readout["heartbeat"] = True
+        self.suppressed = 0
+        self.lastPublished = readout
+
+        if self.localBridge is not None:
+            self.localBridge.send(readout)
+
+        if self.priorityPublishing is not None:
+            if self.broadcaster.publisher is None:
+                self.broadcaster.broker_connect().startPublisher(**self.priorityPublishing)
+            self.broadcaster.publish(readout, alarm=alarm)
+        elif self.broadcaster.is_connected == False:
             self.logger.info(chalk.yellowBright("Broadcaster is not connected. ") + chalk.white("Connecting and sending the latest readout."))
             self.broadcaster.broker_connect().send(data=readout)
         else:
@@ -49,6 +107,29 @@ class SensorData():
             self.broadcaster.send(data=readout)
         
         return readout
+
+    def publishReason(self, readout):
+        '''
+        Returns why a readout should be published ("always", "first",
+        "changed" or "heartbeat"), or None when it is within the deadband.
+        Alarm readouts bypass this check in getReadout.
+        '''
+        rbe = self.reportByException
+        if not rbe:
+            return "always"
+        last = self.lastPublished
+        if last is None:
+            return "first"
+        for metric in ("temp", "rhum"):
+            band = rbe.get(metric, {})
+            delta = abs(readout[metric] - last[metric])
+            if "absolute" in band and delta > band["absolute"]:
+                return "changed"
+            if "relative" in band and delta > band["relative"] * abs(last[metric]):
+                return "changed"
+        if "heartbeat" in rbe and readout["timestamp"] - last["timestamp"] >= rbe["heartbeat"]:
+            return "heartbeat"
+        return None
     
 # App Setup/Initialization
 if sys.argv.__len__() == 1:
@@ -56,5 +137,7 @@ if sys.argv.__len__() == 1:
     exit()
 if __name__ == "__main__":
     interval = sys.argv[1]
+    startMetrics(device.get("metricsPort"), device.get("metricsLogInterval"))
+    startProfiling("dataServer")
     app = SensorData(interval)
     app.startSensing()
\ No newline at end of file
@@ -0,0 +1,81 @@
+'''
+Streams retained readout history to CSV or Parquet with constant memory.
+
+    python export.py history.csv --start 2026-10-18 --end 2026-10-19
+    python export.py history.parquet --format parquet --client myClientId
+'''
+import argparse, csv, datetime
+
+from historyStore import COLUMNS, HistoryStore
+
+try:
+    # Parquet export is optional and only needs pyarrow when requested
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+def parseTime(value):
+    '''
+    Accepts epoch seconds or an ISO date/datetime (local time).
+    '''
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def exportHistory(store, path, format="csv", start=None, end=None, clientId=None, chunkSize=5000, progressCallback=None):
+    '''
+    Writes matching readouts to path chunk by chunk and returns the number
+    of rows written. progressCallback, if given, receives the running row
+    count after each chunk.
+    '''
+    rows = 0
+    if format == "parquet":
+        if pyarrow is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        schema = pyarrow.schema([
+            ("timestamp", pyarrow.float64()),
+            ("clientId", pyarrow.string()),
+            ("temp", pyarrow.float64()),
+            ("rhum", pyarrow.float64())
+        ])
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            for chunk in store.iterChunks(start, end, clientId, chunkSize):
+                columns = list(zip(*chunk))
+                writer.write_table(pyarrow.table([list(column) for column in columns], schema=schema))
+                rows += len(chunk)
+                if progressCallback is not None:
+                    progressCallback(rows)
+    else:
+        with open(path, "w", newline="") as out:
+            writer = csv.writer(out)
+            writer.writerow(COLUMNS)
+            for chunk in store.iterChunks(start, end, clientId, chunkSize):
+                writer.writerows(chunk)
+                rows += len(chunk)
+                if progressCallback is not None:
+                    progressCallback(rows)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export retained readout history.")
+    parser.add_argument("path", help="output file")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None, help="defaults to the output file extension")
+    parser.add_argument("--start", help="include readouts at or after this time (epoch or ISO)")
+    parser.add_argument("--end", help="include readouts before this time (epoch or ISO)")
+    parser.add_argument("--client", dest="clientId", help="only export this clientId")
+    parser.add_argument("--history", help="history database path (defaults to historyPath in device.json)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    format = args.format or ("parquet" if args.path.endswith(".parquet") else "csv")
+    try:
+        store = HistoryStore(args.history)
+    except ValueError as e:
+        parser.error(str(e))
+    rows = exportHistory(store, args.path, format, parseTime(args.start), parseTime(args.end), args.clientId, args.chunk_size)
+    store.close()
+    print(f"Exported {rows} readouts to {args.path}")
@@ -1,30 +1,82 @@
-import ast, datetime, json
+import datetime, itertools, json, os, time
 import numpy as np
 import pandas as pd
 import platform
 
+from alarms import AlarmEngine, METRICS, defaultLimits, isValidReadout
+from broadcaster import Broadcaster
+from export import exportHistory
+from historyStore import DEFAULT_PATH, HistoryStore
+from localBridge import LocalBridgeReceiver
 from mplCanvas import MplCanvas
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
-from sensor import AHT20Sensor
 from simple_chalk import chalk
 from sqsHandler import SQSHandler
+from collections import OrderedDict, deque
 from statistics import mean
 from utils.convert import convertTemperature
 from utils.custom_logging import Logger
+from utils.metrics import registry, startMetrics
+from utils.profiling import profiled, startProfiling
 from utils.worker import Worker
 
 file = open("./data/device.json")
 device = json.load(file)
 file.close()
 
+framesRendered = registry.counter("gui_frames_rendered_total", "Readouts rendered by updateLabels")
+updateSeconds = registry.histogram("gui_update_seconds", "Time spent in SensorDisplay.updateLabels")
+statsSeconds = registry.histogram("gui_stats_seconds", "Time spent in SensorDisplay.getMinMaxAvg")
+graphSeconds = registry.histogram("gui_graph_seconds", "Time spent in SensorDisplay.graphData")
+historySize = registry.gauge("gui_history_readouts", "Readouts held in the display history")
+
 class SensorDisplay(QMainWindow):
 
-    def __init__(self, *args, **kwargs):
+    # Carries encoded readouts from poller/subscriber threads to the UI thread
+    readoutReceived = pyqtSignal(object)
+    # Carries merged readouts and their SQS receipt handles from the consumer pool
+    deliveryReceived = pyqtSignal(object, object)
+
+    def __init__(self, *args, headless=False, source=None, retain=True, **kwargs):
+        '''
+        headless skips showing the window and starting the poller so the
+        display can be driven directly (e.g. under the offscreen Qt
+        platform). source is a callable returning the next encoded readout
+        or None, and defaults to polling SQS. retain=False keeps readouts
+        out of the retained history store (e.g. when replaying a
+        recording); headless displays never retain.
+
+        The "ingest" key in device.json selects how live readouts arrive:
+        "sqs" (default) polls the queue, "mqtt" subscribes to the sensor
+        topic directly and "local" listens on the same-host bridge socket
+        fed by dataServer. Both keep SQS polling as a backfill path unless
+        "sqsBackfill" is false. Adding a "consumerPool" key replaces the
+        single SQS poller with several concurrent receivers.
+        '''
         super(SensorDisplay,self).__init__(*args, **kwargs)
         self.logger = Logger("SensorDisplay")
-        self.sqs = SQSHandler()
+        self.headless = headless
+        self.ingest = device.get("ingest", "sqs")
+        self.subscriber = None
+        self.localReceiver = None
+        self.consumerPool = None
+        self.polling = False
+        self.sparklinesPanel = None # Created on the first graphData call
+        self.seenReadouts = OrderedDict()  # Recent (clientId, timestamp) keys, for de-duplication
+        self.seenLimit = device.get("dedupLimit", 10000)
+        self.readoutReceived.connect(self.receiveReadout)
+        self.deliveryReceived.connect(self.applyDelivery)
+
+        # Retained history for exports; set "historyPath" to null to disable
+        historyPath = device.get("historyPath", DEFAULT_PATH)
+        self.historyStore = HistoryStore(historyPath) if historyPath and retain and not headless else None
+        self.sqs = None
+        if source is None:
+            self.sqs = SQSHandler()
+            source = self.sqs.getMessage
+        self.source = source
 
         self.system = platform.system()
         self.logger.info(chalk.white("System detected") + self.logger.sep + chalk.green(self.system)) 
@@ -35,23 +87,14 @@ class SensorDisplay(QMainWindow):
             "temp": -9999,
             "rhum": -9999,
             "unit": "C",
-            "history": [],
+            "history": deque(maxlen=device.get("historyLimit", 1000)), # Latest readouts kept in memory; older ones live in the history store
             "lastUpdated": datetime.datetime.now()
         }
 
-        self.limits = {
-            "temp": {
-                "min": 10,
-                "max": 32
-            },
-            "rhum": {
-                "min": 20,
-                "max": 50
-            },
-            "n": {
-                "graph": 48, # Number of readouts for plotting on graphs
-                "stats": 10 # Number of readouts for calculating min/max/avg
-            }
+        self.limits = defaultLimits() # °C / %RH limits shared with the alarm engine
+        self.limits["n"] = {
+            "graph": 48, # Number of readouts for plotting on graphs
+            "stats": 10 # Number of readouts for calculating min/max/avg
         }
 
         self.stats = {
@@ -86,9 +129,28 @@ class SensorDisplay(QMainWindow):
         self.colorTooHumid = "#DB4437"
         self.colorTooDry = "#1789FC"
 
+        self.alarmLabels = {
+            "temp": {
+                "high": ("Too hot!", self.colorTooHot),
+                "low": ("Too cold!", self.colorTooCold),
+                "normal": ("Normal", self.colorNormal)
+            },
+            "rhum": {
+                "high": ("Too humid!", self.colorTooHumid),
+                "low": ("Too dry!", self.colorTooDry),
+                "normal": ("Normal", self.colorNormal)
+            }
+        }
+
         self.cBlack = "rgb(30, 27, 24)"
         self.QCBlack = QColor(30,27,24)
         
+        # Alarms: labels only change when the engine reports a state transition.
+        # States are kept per clientId, e.g. {clientId: {"temp": {"level": "high", "rate": "steady"}}}
+        self.alarmStates = {}
+        self.alarms = AlarmEngine(limits=self.limits, config=device.get("alarms"))
+        self.alarms.subscribe(self.applyAlarmEvent)
+
         # Layout Constants
         self.stretchValue = 1
         
@@ -245,6 +307,13 @@ class SensorDisplay(QMainWindow):
         # Add the Button Panel to the main layout grid ------------------------
         self.layoutContainer.addLayout(self.buttonPanel, 0, 0, 1, 2)
 
+        ## Action to export retained history (Ctrl+E or long-press menu) --
+        self.exportAction = QAction("Export history to CSV", self)
+        self.exportAction.setShortcut("Ctrl+E")
+        self.exportAction.triggered.connect(self.startExport)
+        self.addAction(self.exportAction)
+        self.setContextMenuPolicy(Qt.ActionsContextMenu)
+
         """
         App Window Layout =====================================================
         """
@@ -257,22 +326,34 @@ class SensorDisplay(QMainWindow):
         widget = QWidget()
         widget.setLayout(self.layoutContainer)
         self.setCentralWidget(widget)
-        self.show()
         self.threadpool = QThreadPool()
         self.logger.info(chalk.white("Multithreading with maximum ") + chalk.blue(self.threadpool.maxThreadCount()) + chalk.white(" threads."))
+        if self.headless:
+            self.logger.info(chalk.white("Running headless; window and polling not started."))
+            return
+        self.show()
         if self.system == "Darwin":
             self.show()
         else:
             self.showFullScreen()
-        self.start()
+        liveSource = None
+        if self.ingest == "mqtt":
+            liveSource = self.subscribe()
+        elif self.ingest == "local":
+            liveSource = self.listenLocal()
+        if liveSource is None or device.get("sqsBackfill", True):
+            if self.sqs is not None and "consumerPool" in device:
+                self.consumerPool = self.sqs.startConsumers(self.deliveryReceived.emit)
+            else:
+                self.start()
         # End __init__ -~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~-~=~
 
     def start(self):
         # Pass the function to execute
         try: 
-            worker = Worker(self.startPolling)
+            self.polling = True
+            worker = Worker(self.pollLoop)
             self.logger.info(f"Worker started. • {worker}")
-            worker.signals.progress.connect(self.updateLabels)
             worker.signals.result.connect(self.workerResult)
             worker.signals.finished.connect(self.workerFinished)
 
@@ -281,18 +362,165 @@ class SensorDisplay(QMainWindow):
         except (KeyboardInterrupt, EOFError):
             self.shutdown()
 
+    # One long-lived worker polls repeatedly, rather than a new Worker (and
+    # WorkerSignals) per poll; it is restarted by workerFinished if it fails
+    def pollLoop(self, progressCallback):
+        while self.polling:
+            self.startPolling(progressCallback)
+
     def startPolling(self, progressCallback):
-        self.logger.info("Polling for SQS Messages")
+        self.logger.info("Polling for readouts")
         try:
-            readout = self.sqs.getMessage()
+            # After downtime, drain a deep SQS backlog in one go and render only the final state
+            if self.sqs is not None:
+                # Delete (or release) drained messages the UI thread has applied
+                self.sqs.flush()
+            if self.sqs is not None and self.sqs.isBacklogged():
+                readouts, receipts = self.sqs.drainBacklog()
+                if receipts:
+                    self.deliveryReceived.emit(readouts, receipts)
+                return
+            readout = self.source()
             if readout != None:
                 self.logger.debug('Received readout :: %s' % readout)
-                readout = readout.decode()
-                self.data['history'].append(readout)
-                progressCallback.emit(readout)
+                self.readoutReceived.emit(readout)
         except (KeyboardInterrupt, EOFError):
             self.shutdown()
 
+    def subscribe(self):
+        # Receive readouts pushed over MQTT; SQS stays available as a fallback
+        try:
+            # The wildcard also matches the sensor topic itself and its /alarm tier
+            self.subscriber = Broadcaster(listener=True, topic="aht20sensor/#", onMessage=self.readoutReceived.emit)
+            self.subscriber.broker_connect().listen()
+            self.logger.info(chalk.white("Subscribed to ") + chalk.blueBright(self.subscriber.topic) + chalk.white(" for live readouts."))
+        except Exception as e:
+            self.logger.warn(f"MQTT subscription failed, falling back to SQS polling: {e}")
+            self.subscriber = None
+        return self.subscriber
+
+    def listenLocal(self):
+        # Receive readouts from a dataServer on the same host, bypassing the cloud
+        try:
+            self.localReceiver = LocalBridgeReceiver(onMessage=self.readoutReceived.emit)
+            self.localReceiver.start()
+        except OSError as e:
+            self.logger.warn(f"Local bridge unavailable, falling back to SQS polling: {e}")
+            self.localReceiver = None
+        return self.localReceiver
+
+    # Slot for every incoming payload, whichever source delivered it. A
+    # payload holds one readout or a batch (list) of readouts, either
+    # encoded or already decoded.
+    def receiveReadout(self, payload):
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        if isinstance(payload, str):
+            try:
+                parsed = json.loads(payload)
+            except ValueError:
+                self.logger.warn(f"Discarding malformed payload: {payload}")
+                return
+        else:
+            parsed = payload
+        if not isinstance(parsed, list):
+            parsed = [parsed]
+        # Anything can be published under the subscribed topics; an exception
+        # here would abort the application, so drop what cannot be displayed
+        invalid = [readout for readout in parsed if not isValidReadout(readout)]
+        if invalid:
+            self.logger.warn(f"Discarding {len(invalid)} invalid readouts: {invalid}")
+            parsed = [readout for readout in parsed if isValidReadout(readout)]
+
+        # The same readout can arrive over several sources; late ones (e.g.
+        # SQS backfilling a gap in the live stream) are kept in timestamp order
+        accepted = {}
+        for readout in sorted(parsed, key=lambda readout: readout.get('timestamp', 0)):
+            key = (readout.get('clientId'), readout.get('timestamp', 0))
+            if key in self.seenReadouts or key in accepted:
+                self.logger.debug(f"Skipping duplicate readout: {readout}")
+                continue
+            accepted[key] = readout
+
+        # Every readout goes to the store; it ignores ones it already holds
+        if self.historyStore is not None and parsed:
+            self.historyStore.append(parsed)
+        if not accepted:
+            return
+        self.alarms.evaluate(list(accepted.values()))
+
+        # Readouts only count as seen once applied, so a failed payload can be
+        # delivered again; undo the history inserts if the display update fails
+        inserted = []
+        try:
+            for readout in accepted.values():
+                inserted.append(self.insertHistory(readout))
+            self.updateLabels()
+        except Exception:
+            for entry in inserted:
+                if entry is not None:
+                    self.data['history'].remove(entry)
+            raise
+        for key in accepted:
+            self.seenReadouts[key] = None
+            if len(self.seenReadouts) > self.seenLimit:
+                self.seenReadouts.popitem(last=False)
+
+    # Helper Method to add a readout to the history, keeping it in timestamp
+    # order. Returns the inserted entry, or None if it was too old to keep.
+    def insertHistory(self, readout):
+        history = self.data['history']
+        timestamp = readout.get('timestamp', 0)
+        entry = json.dumps(readout)
+        index = len(history)
+        # Late readouts are usually only a few places behind, so walk back from the newest
+        while index > 0 and json.loads(history[index - 1]).get('timestamp', 0) > timestamp:
+            index -= 1
+        if index == len(history):
+            history.append(entry)
+            return entry
+        if len(history) == history.maxlen:
+            if index == 0:
+                return None # Older than everything held in memory; the history store still retains it
+            history.popleft()
+            index -= 1
+        history.insert(index, entry)
+        return entry
+
+    # Slot for SQS deliveries from the consumer pool or a backlog catch-up.
+    # The messages are deleted only once their readouts have been applied,
+    # and redelivered otherwise.
+    def applyDelivery(self, readouts, receipts):
+        receiver = self.consumerPool or self.sqs
+        try:
+            self.receiveReadout(readouts)
+        except Exception as e:
+            self.logger.error(f"Failed to apply {len(readouts)} readouts, releasing {len(receipts)} messages: {e}")
+            receiver.release(receipts)
+            return
+        receiver.acknowledge(receipts)
+
+    # Method to export the retained history off the UI thread
+    def startExport(self):
+        if self.historyStore is None:
+            self.logger.warn("History retention is disabled; nothing to export.")
+            return
+        path = os.path.join(device.get("exportDir", "./exports"), f"history-{datetime.datetime.now():%Y%m%d-%H%M%S}.csv")
+        worker = Worker(self.runExport, path)
+        worker.signals.result.connect(self.exportFinished)
+        worker.signals.error.connect(lambda error: self.logger.error(f"Export failed: {error[1]}"))
+        self.threadpool.start(worker)
+        self.logger.info(chalk.white("Exporting history to ") + chalk.blueBright(path))
+
+    def runExport(self, path, progressCallback):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows = exportHistory(self.historyStore, path, progressCallback=progressCallback.emit)
+        return path, rows
+
+    def exportFinished(self, result):
+        path, rows = result
+        self.logger.info(chalk.white("Exported ") + chalk.blueBright(rows) + chalk.white(" readouts to ") + chalk.blueBright(path))
+
     # Method to handle temperature conversions
     def convertCurrentTemperature(self):
         if self.data['temp'] <= -9999:
@@ -329,9 +557,22 @@ class SensorDisplay(QMainWindow):
     
     # Method to shut down and close the program
     def shutdown(self):
+        self.polling = False
+        if self.consumerPool is not None:
+            self.consumerPool.stop()
+        elif self.sqs is not None and self.sqs.sqs is not None:
+            self.sqs.flush()
+        if self.subscriber is not None:
+            self.subscriber.broker_disconnect()
+            self.subscriber.mqttc.loop_stop()
+        if self.localReceiver is not None:
+            self.localReceiver.stop()
+        if self.historyStore is not None:
+            self.historyStore.close()
         self.close()
     
     # Method for calculating and displaying the stats for N readouts
+    @profiled("SensorDisplay.getMinMaxAvg")
     def getMinMaxAvg(self):
         '''
         Key Interaction:
@@ -340,6 +581,7 @@ class SensorDisplay(QMainWindow):
         using the readouts stored in self.history. The stats labels are
         updated with the calculated values.
         '''
+        start = time.perf_counter()
         temps, rhums, timestamps, clientId = self.mapReadouts(self.limits['n']['stats']).values()
 
         self.stats['temp']['min'] = round(min(temps))
@@ -353,8 +595,10 @@ class SensorDisplay(QMainWindow):
         rHumidityStatText = f"Min: {self.stats['rhum']['min']} / Max: {self.stats['rhum']['max']} / Avg: {self.stats['rhum']['avg']}"
         self.temperatureStats.setText(temperatureStatText)
         self.humidityStats.setText(rHumidityStatText)
+        statsSeconds.observe(time.perf_counter() - start)
 
     # Method for graphing the sparklines to display/update on the GUI
+    @profiled("SensorDisplay.graphData")
     def graphData(self):
         '''
         Key Interaction:
@@ -362,7 +606,8 @@ class SensorDisplay(QMainWindow):
         graph for the historic values of temperature and relative humidity.
         It updates the stats labels with the result graph.
         '''
-        self.logger.debug(f"Plotting graphs using history: {self.data['history']}")
+        start = time.perf_counter()
+        self.logger.debug(f"Plotting graphs using the latest {self.limits['n']['graph']} of {len(self.data['history'])} readouts")
         
         yTValues, yRHValues, xTimestamps, clientId = self.mapReadouts(self.limits['n']['graph']).values()
 
@@ -391,29 +636,29 @@ class SensorDisplay(QMainWindow):
         itsDry = self.colorTooDry
         itsHumid = self.colorTooHumid
 
-        # Mask the Temperature Data and create the sparkline using line colors
+        # Create the sparkline canvases and layout once, then replot them in place
+        if self.sparklinesPanel is None:
+            self.createSparklines()
+
+        # Mask the Temperature Data and update the sparkline using line colors
         tUpper = np.ma.masked_where(df['temperature'] < maxTempLimit, df['temperature'])
         tLower = np.ma.masked_where(df['temperature'] > minTempLimit, df['temperature'])
-        sparklineT = MplCanvas(self, width=4, height=1, dpi=100)
-        sparklineT.axes.plot(df['timestamp'], df['temperature'], color=itsNormal)
-        sparklineT.axes.plot(df['timestamp'], tLower, color=itsCold)
-        sparklineT.axes.plot(df['timestamp'], tUpper, color=itsHot)
+        self.sparklineTemperature.replot(df['timestamp'], [(df['temperature'], itsNormal), (tLower, itsCold), (tUpper, itsHot)])
 
-        # Mask the Humidity Data and create the sparkline using line colors
+        # Mask the Humidity Data and update the sparkline using line colors
         hUpper = np.ma.masked_where(df['humidity'] < maxHumLimit, df['humidity'])
         hLower = np.ma.masked_where(df['humidity'] > minHumLimit, df['humidity'])
-        sparklineH = MplCanvas(self, width=4, height=1, dpi=100)
-        sparklineH.axes.plot(df['timestamp'], df['humidity'], color=itsNormal)
-        sparklineH.axes.plot(df['timestamp'], hLower, color=itsDry)
-        sparklineH.axes.plot(df['timestamp'], hUpper, color=itsHumid)
+        self.sparklineHumidity.replot(df['timestamp'], [(df['humidity'], itsNormal), (hLower, itsDry), (hUpper, itsHumid)])
+        graphSeconds.observe(time.perf_counter() - start)
 
-        # Create the sparkline graph layout and add/overwrite position on main layout
+    # Helper Method to create the sparkline graph layout and add it to the main layout
+    def createSparklines(self):
         self.sparklinesPanel = QHBoxLayout()
-        self.sparklineTemperature = sparklineT
+        self.sparklineTemperature = MplCanvas(self, width=4, height=1, dpi=100)
         self.sparklineTemperatureLabel = QLabel("Temperature:")
         self.sparklineTemperatureLabel.setFont(self.graphLabelFont)
         self.sparklineTemperatureLabel.setAlignment( Qt.AlignRight | Qt.AlignVCenter)
-        self.sparklineHumidity = sparklineH
+        self.sparklineHumidity = MplCanvas(self, width=4, height=1, dpi=100)
         self.sparklineHumidityLabel = QLabel("Humidity:")
         self.sparklineHumidityLabel.setFont(self.graphLabelFont)
         self.sparklineHumidityLabel.setAlignment( Qt.AlignRight | Qt.AlignVCenter)
@@ -431,14 +676,18 @@ class SensorDisplay(QMainWindow):
         Returns a dict of n temps, rhums, timestamps. temps will be returned
         using the current temperatureUnit.
         '''
-        readoutsToMap = self.data['history'][-n:]
+        # Walk back from the newest readout; slicing a deque from the left is O(len)
+        readoutsToMap = list(itertools.islice(reversed(self.data['history']), n))[::-1]
         timestamps = []
         temps = []
         rhums = []
+        clientId = None
         for count, readout in enumerate(readoutsToMap):
-            self.logger.debug(f'mapReadouts using readout: {ast.literal_eval(readout)}')
+            parsed = json.loads(readout)
+            self.logger.debug(f'mapReadouts using readout: {parsed}')
 
-            temp, rhum, timestamp, clientId = ast.literal_eval(readout).values()            
+            # Readouts may carry extra fields (e.g. suppressed, heartbeat)
+            temp, rhum, timestamp, clientId = parsed['temp'], parsed['rhum'], parsed['timestamp'], parsed['clientId']
             if self.data['unit'] == "F":
                 temp = convertTemperature(temp, self.data['unit'])
             
@@ -454,7 +703,9 @@ class SensorDisplay(QMainWindow):
         return mappedValues
     
     # Method to update the labels on the screen.
+    @profiled("SensorDisplay.updateLabels")
     def updateLabels(self):
+        start = time.perf_counter()
         self.logger.debug("updateLabels called.")
         readout = json.loads(self.data['history'][ len(self.data['history']) - 1 ])
         self.logger.info(f"updateLabels working with latest readout: {readout}")
@@ -462,33 +713,6 @@ class SensorDisplay(QMainWindow):
         t = readout['temp']
         h = readout['rhum']
 
-        # Alarms: Handle if temperature/humidity exceed limits
-        ## Temperature ----------------------------------------------
-        tempErrorText = ""
-        tempErrorColor = ""
-        if t > self.limits["temp"]["max"]:
-            tempErrorText = "Too hot!"
-            tempErrorColor = f"color: {self.colorTooHot}"
-        elif t < self.limits["temp"]["min"]:
-            tempErrorText = "Too cold!"
-            tempErrorColor = f"color: {self.colorTooCold}"
-        else:
-            tempErrorText = "Normal"
-            tempErrorColor = f"color: {self.colorNormal}"
-                
-        ## Humidity -------------------------------------------------
-        rHumErrorText = ""
-        rHumErrorColor = ""
-        if h > self.limits["rhum"]["max"]:
-            rHumErrorText = "Too humid!"
-            rHumErrorColor = f"color: {self.colorTooHumid}"
-        elif h < self.limits["rhum"]["min"]:
-            rHumErrorText = "Too dry!"
-            rHumErrorColor = f"color: {self.colorTooDry}"
-        else:
-            rHumErrorText = "Normal"
-            rHumErrorColor = f"color: {self.colorNormal}"
-
         if self.data['unit'] == "F":
             t = convertTemperature(t, self.data['unit'])
 
@@ -496,19 +720,35 @@ class SensorDisplay(QMainWindow):
         self.data["temp"] = t
         self.data["rhum"] = h
         self.temperatureLabel.setText(f"{round(self.data['temp'])}")
-        self.temperatureError.setText(tempErrorText)
-        self.temperatureError.setStyleSheet(tempErrorColor)
         self.humidityLabel.setText(f"{round(self.data['rhum'])}")
-        self.humidityError.setText(rHumErrorText)
-        self.humidityError.setStyleSheet(rHumErrorColor)
         self.getMinMaxAvg()
         self.graphData()
+        framesRendered.inc()
+        historySize.set(len(self.data['history']))
+        updateSeconds.observe(time.perf_counter() - start)
         self.logger.debug("updateLabels finished.")
 
+    # Subscriber for alarm engine events; only called on state transitions
+    def applyAlarmEvent(self, event):
+        states = self.alarmStates.setdefault(event.clientId, {metric: {"level": None, "rate": "steady"} for metric in METRICS})
+        states[event.metric][event.kind] = event.state
+        # Several clients can share the display, so show the worst state among them
+        levels = [clientStates[event.metric]["level"] for clientStates in self.alarmStates.values()]
+        rates = [clientStates[event.metric]["rate"] for clientStates in self.alarmStates.values()]
+        level = next((level for level in ("high", "low") if level in levels), "normal")
+        rate = next((rate for rate in ("rising", "falling") if rate in rates), "steady")
+        text, color = self.alarmLabels[event.metric][level]
+        if rate != "steady":
+            text += f" ({rate} fast)"
+        label = self.temperatureError if event.metric == "temp" else self.humidityError
+        label.setText(text)
+        label.setStyleSheet(f"color: {color}")
+
     # Helper Method called when a worker thread ends.
     def workerFinished(self):
         self.logger.info("Worker finished.")
-        self.start()
+        if self.polling:
+            self.start()
 
     # Helper Method to log the result of the thread.
     def workerResult(self,it):
@@ -543,9 +783,23 @@ style = """
     }
 """
 
-if __name__ == "__main__":
+def createApplication(headless=False):
+    '''
+    Creates the QApplication with the display stylesheet. headless selects
+    the offscreen Qt platform so no display server is needed.
+    '''
+    if headless:
+        os.environ["QT_QPA_PLATFORM"] = "offscreen"
     app = QApplication([])
     app.setStyleSheet(style)
     app.setAttribute(Qt.AA_UseHighDpiPixmaps)
+    return app
+
+if __name__ == "__main__":
+    startMetrics(device.get("metricsPort"), device.get("metricsLogInterval"))
+    profileDumper = startProfiling("gui")
+    app = createApplication()
     window = SensorDisplay()
-    app.exec_()
\ No newline at end of file
+    app.exec_()
+    if profileDumper is not None:
+        profileDumper.stop()
\ No newline at end of file
@@ -0,0 +1,77 @@
+import json, sqlite3, threading
+
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+file = open("./data/device.json")
+device = json.load(file)
+file.close()
+
+DEFAULT_PATH = "./data/history.sqlite3"
+COLUMNS = ("timestamp", "clientId", "temp", "rhum")
+
+class HistoryStore(object):
+    '''
+    Retained readout history in SQLite. Readouts are keyed by clientId and
+    timestamp, so the same readout delivered twice is stored once. Readers
+    open their own connection and stream rows in chunks.
+    '''
+
+    def __init__(self, path=None):
+        self.logger = Logger("HistoryStore")
+        self.path = path or device.get("historyPath", DEFAULT_PATH)
+        if not self.path:
+            raise ValueError('History retention is disabled ("historyPath" is null in device.json); pass a database path')
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets exports read while the GUI keeps writing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS readouts ("
+            "timestamp REAL NOT NULL, clientId TEXT NOT NULL, temp REAL, rhum REAL, "
+            "PRIMARY KEY (clientId, timestamp))"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS readouts_timestamp ON readouts (timestamp)")
+        self.connection.commit()
+        self.logger.info(chalk.white("Retaining readout history in ") + chalk.blueBright(self.path))
+
+    def append(self, readouts):
+        rows = [(r['timestamp'], r.get('clientId') or "", r['temp'], r['rhum']) for r in readouts]
+        with self.lock:
+            self.connection.executemany("INSERT OR IGNORE INTO readouts (timestamp, clientId, temp, rhum) VALUES (?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def iterChunks(self, start=None, end=None, clientId=None, chunkSize=5000):
+        '''
+        Yields lists of (timestamp, clientId, temp, rhum) rows in timestamp
+        order, filtered by an optional [start, end) range and clientId.
+        '''
+        query = "SELECT timestamp, clientId, temp, rhum FROM readouts"
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("timestamp < ?")
+            params.append(end)
+        if clientId is not None:
+            conditions.append("clientId = ?")
+            params.append(clientId)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY timestamp"
+
+        connection = sqlite3.connect(self.path)
+        try:
+            cursor = connection.execute(query, params)
+            rows = cursor.fetchmany(chunkSize)
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(chunkSize)
+        finally:
+            connection.close()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
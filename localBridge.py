@@ -0,0 +1,76 @@
+import json, os, socket, threading
+
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+from utils.metrics import registry
+
+file = open("./data/device.json")
+device = json.load(file)
+file.close()
+
+# Unix domain datagram socket shared by dataServer and the GUI on the same host
+DEFAULT_SOCKET = "/tmp/aht20sensor.sock"
+
+bridgeSent = registry.counter("local_bridge_sent_total", "Readouts sent over the local bridge")
+bridgeDropped = registry.counter("local_bridge_dropped_total", "Readouts not delivered because no local receiver was listening")
+bridgeReceived = registry.counter("local_bridge_received_total", "Readouts received over the local bridge")
+
+class LocalBridgeSender(object):
+    '''
+    Sends readouts to a same-host GUI without a cloud round trip. Readouts
+    are dropped when no receiver is bound or it stops draining the socket.
+    '''
+
+    def __init__(self, path=None):
+        self.logger = Logger("LocalBridge")
+        self.path = path or device.get("localSocket", DEFAULT_SOCKET)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Wait briefly when the receiver's queue is full rather than dropping at once
+        self.sock.settimeout(0.05)
+        self.logger.info(chalk.white("Local bridge sending to ") + chalk.blueBright(self.path))
+
+    def send(self, data):
+        try:
+            self.sock.sendto(json.dumps(data).encode(), self.path)
+        except OSError as e:
+            bridgeDropped.inc()
+            self.logger.debug(f"Local bridge readout dropped: {e}")
+            return False
+        bridgeSent.inc()
+        return True
+
+    def close(self):
+        self.sock.close()
+
+class LocalBridgeReceiver(threading.Thread):
+    '''
+    Binds the bridge socket and calls onMessage with each encoded readout.
+    '''
+
+    def __init__(self, onMessage, path=None):
+        super(LocalBridgeReceiver, self).__init__(daemon=True)
+        self.logger = Logger("LocalBridge")
+        self.onMessage = onMessage
+        self.path = path or device.get("localSocket", DEFAULT_SOCKET)
+        # Remove a socket file left behind by a previous run
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.running = True
+        self.logger.info(chalk.white("Local bridge listening on ") + chalk.blueBright(self.path))
+
+    def run(self):
+        while self.running:
+            try:
+                payload = self.sock.recv(65536)
+            except OSError:
+                break
+            bridgeReceived.inc()
+            self.onMessage(payload)
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -24,4 +24,13 @@ class MplCanvas(FigureCanvasQTAgg):
         fig.tight_layout()
 
         super(MplCanvas, self).__init__(fig)
-        
\ No newline at end of file
+
+    # Replaces the plotted lines in place so the canvas can be reused for every update
+    def replot(self, x, series):
+        for line in list(self.axes.lines):
+            line.remove()
+        for y, color in series:
+            self.axes.plot(x, y, color=color)
+        self.axes.relim()
+        self.axes.autoscale_view()
+        self.draw_idle()
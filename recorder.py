@@ -0,0 +1,192 @@
+'''
+Record-and-replay for readout streams.
+
+Set "recordPath" in data/device.json (or the AHT20_RECORD environment
+variable) to capture every readout crossing the SQSHandler and Broadcaster
+boundaries into a gzipped JSON-lines file. The path may contain {program}
+and {pid} so dataServer and the GUI write separate files. Replay with:
+
+    python recorder.py info recording.jsonl.gz
+    python recorder.py replay recording.jsonl.gz --target headless --speed max
+    python recorder.py replay recording.jsonl.gz --target gui --speed 1000
+    python recorder.py replay recording.jsonl.gz --target broadcaster --speed 1
+'''
+import argparse, atexit, gzip, json, os, sys, threading, time
+
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+file = open("./data/device.json")
+device = json.load(file)
+file.close()
+
+FORMAT = "aht20-recording"
+VERSION = 1
+
+class Recorder(object):
+    '''
+    Appends [offsetSeconds, source, payload] lines after a header line.
+    Payloads are stored as parsed JSON where possible to keep files small.
+    '''
+
+    def __init__(self, path, flushEvery=50):
+        self.logger = Logger("Recorder")
+        self.path = path
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.startedMonotonic = time.monotonic()
+        self.flushEvery = flushEvery
+        self.count = 0
+        self.out = gzip.open(path, "at")
+        self.out.write(json.dumps({"format": FORMAT, "version": VERSION, "started": self.started}) + "\n")
+        atexit.register(self.close)
+        self.logger.info(chalk.white("Recording readouts to ") + chalk.blueBright(path))
+
+    def record(self, source, payload):
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                pass
+        line = json.dumps([round(time.monotonic() - self.startedMonotonic, 6), source, payload], separators=(",", ":"))
+        with self.lock:
+            if self.out.closed:
+                return
+            self.out.write(line + "\n")
+            self.count += 1
+            if self.count % self.flushEvery == 0:
+                self.out.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.out.closed:
+                self.out.close()
+
+recordPath = os.environ.get("AHT20_RECORD") or device.get("recordPath")
+program = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+activeRecorder = Recorder(recordPath.format(program=program, pid=os.getpid())) if recordPath else None
+
+def record(source, payload):
+    '''
+    Records a payload when recording is enabled; otherwise does nothing.
+    '''
+    if activeRecorder is not None:
+        activeRecorder.record(source, payload)
+
+class Replayer(object):
+    '''
+    Reads a recording back. speed scales the original timing (1 is real
+    time, 1000 is 1000x faster); None replays as fast as possible.
+    sources optionally limits replay to some recorded sources.
+    '''
+
+    def __init__(self, path, speed=1.0, sources=None):
+        self.path = path
+        self.speed = speed
+        self.sources = sources
+        self.iterator = None
+
+    def records(self):
+        with gzip.open(self.path, "rt") as recording:
+            for line in recording:
+                entry = json.loads(line)
+                if isinstance(entry, dict):
+                    # Header line; appended recordings restart their offsets
+                    if entry.get("format") != FORMAT:
+                        raise ValueError(f"{self.path} is not a readout recording")
+                    continue
+                offset, source, payload = entry
+                if self.sources is None or source in self.sources:
+                    yield offset, source, payload
+
+    def __iter__(self):
+        # Yields payloads, sleeping so they are due at their scaled offsets
+        start = None
+        first = None
+        for offset, source, payload in self.records():
+            if self.speed:
+                if start is None:
+                    start, first = time.monotonic(), offset
+                delay = start + max(offset - first, 0) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield payload
+
+    def source(self):
+        '''
+        Readout source for SensorDisplay: returns the next encoded payload
+        when it is due, or None once the recording is exhausted.
+        '''
+        if self.iterator is None:
+            self.iterator = iter(self)
+        payload = next(self.iterator, None)
+        if payload is None:
+            time.sleep(1)
+            return None
+        return json.dumps(payload).encode()
+
+    def replay(self, sink):
+        '''
+        Passes every payload to sink and returns (count, elapsedSeconds).
+        '''
+        count = 0
+        start = time.perf_counter()
+        for payload in self:
+            sink(payload)
+            count += 1
+        return count, time.perf_counter() - start
+
+def info(path):
+    counts = {}
+    last = 0
+    for offset, source, payload in Replayer(path).records():
+        counts[source] = counts.get(source, 0) + 1
+        last = max(last, offset)
+    print(f"{path}: {sum(counts.values())} payloads over {last:.1f}s")
+    for source, count in sorted(counts.items()):
+        print(f"  {source:<12}: {count}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay a recorded readout stream.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    infoParser = subparsers.add_parser("info", help="summarize a recording")
+    infoParser.add_argument("path")
+    replayParser = subparsers.add_parser("replay", help="replay a recording")
+    replayParser.add_argument("path")
+    replayParser.add_argument("--target", choices=["headless", "gui", "broadcaster"], default="headless")
+    replayParser.add_argument("--speed", default="1", help="playback speed multiplier, or 'max' for as fast as possible")
+    replayParser.add_argument("--source", action="append", dest="sources", help="only replay payloads recorded from this source (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        info(args.path)
+        sys.exit()
+
+    speed = None if args.speed == "max" else float(args.speed)
+    replayer = Replayer(args.path, speed=speed, sources=args.sources)
+
+    if args.target == "broadcaster":
+        from broadcaster import Broadcaster
+        broadcaster = Broadcaster(listener=False, topic="aht20sensor").broker_connect()
+        count, elapsed = replayer.replay(lambda payload: broadcaster.send(data=payload))
+        broadcaster.broker_disconnect()
+    elif args.target == "headless":
+        import logging
+        from gui import SensorDisplay, createApplication
+        app = createApplication(headless=True)
+        window = SensorDisplay(headless=True, source=lambda: None)
+        logging.disable(logging.INFO)
+        count, elapsed = replayer.replay(window.receiveReadout)
+        logging.disable(logging.NOTSET)
+    else:
+        from gui import SensorDisplay, createApplication
+        app = createApplication()
+        # Replayed readouts must not end up in the retained compliance history
+        window = SensorDisplay(source=replayer.source, retain=False)
+        app.exec_()
+        sys.exit()
+
+    rate = count / elapsed if elapsed else 0
+    print(f"Replayed {count} payloads in {elapsed:.3f}s ({rate:.1f} payloads/sec) into {args.target}")
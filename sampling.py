@@ -0,0 +1,57 @@
+from collections import deque
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+class AdaptiveSampler(object):
+    '''
+    Chooses the interval before the next sensor reading. Sampling speeds up
+    to minInterval when a metric changes faster than its rateThreshold (per
+    minute) or comes within margin of an alarm limit, and backs off by
+    backoff per stable reading toward maxInterval. Configured with the
+    "adaptiveSampling" key, e.g.:
+
+        {"minInterval": 5, "maxInterval": 300, "backoff": 1.5, "window": 5,
+         "rateThreshold": {"temp": 0.5, "rhum": 2},
+         "margin": {"temp": 2, "rhum": 5}}
+    '''
+
+    def __init__(self, interval, config, limits):
+        self.logger = Logger("AdaptiveSampler")
+        self.minInterval = float(config.get("minInterval", interval))
+        self.maxInterval = float(config.get("maxInterval", interval))
+        self.backoff = float(config.get("backoff", 1.5))
+        self.rateThreshold = config.get("rateThreshold", {"temp": 0.5, "rhum": 2})
+        self.margin = config.get("margin", {"temp": 2, "rhum": 5})
+        self.limits = limits
+        self.recent = deque(maxlen=max(2, int(config.get("window", 5))))
+        self.interval = min(max(float(interval), self.minInterval), self.maxInterval)
+
+    def ratePerMinute(self, metric):
+        first, last = self.recent[0], self.recent[-1]
+        elapsed = last["timestamp"] - first["timestamp"]
+        if elapsed <= 0:
+            return 0
+        return abs(last[metric] - first[metric]) / elapsed * 60
+
+    def reason(self, readout):
+        # Returns why sampling should speed up, or None when conditions are stable
+        for metric, limits in self.limits.items():
+            value = readout[metric]
+            margin = self.margin.get(metric, 0)
+            if value >= limits["max"] - margin or value <= limits["min"] + margin:
+                return f"{metric} near limits"
+            if len(self.recent) > 1 and metric in self.rateThreshold and self.ratePerMinute(metric) >= self.rateThreshold[metric]:
+                return f"{metric} changing quickly"
+        return None
+
+    def nextInterval(self, readout):
+        self.recent.append(readout)
+        reason = self.reason(readout)
+        previous = self.interval
+        if reason is not None:
+            self.interval = self.minInterval
+        else:
+            self.interval = min(self.interval * self.backoff, self.maxInterval)
+        if self.interval != previous:
+            self.logger.info(chalk.white("Sampling interval ") + chalk.blueBright(f"{previous:g}s -> {self.interval:g}s") + self.logger.sep + chalk.white(reason or "stable"))
+        return self.interval
@@ -1,42 +1,338 @@
-import base64, boto3, json, threading
+import base64, boto3, json, queue, threading, time
+
+from botocore.config import Config
+from alarms import isValidReadout
+from concurrent.futures import ThreadPoolExecutor
+from recorder import record
 
 from simple_chalk import chalk
 from utils.custom_logging import Logger
+from utils.metrics import registry
 
 file = open("./data/device.json")
 device = json.load(file)
 file.close()
 
+receiveCalls = registry.counter("sqs_receive_calls_total", "SQS receive_message calls")
+messagesReceived = registry.counter("sqs_messages_received_total", "SQS messages received")
+receiveSeconds = registry.histogram("sqs_receive_seconds", "Time spent in SQS receive_message calls, including long polling")
+catchUpRuns = registry.counter("sqs_catchup_runs_total", "Backlog catch-up runs")
+catchUpMessages = registry.counter("sqs_catchup_messages_total", "Messages drained by backlog catch-up")
+messagesDeleted = registry.counter("sqs_messages_deleted_total", "Messages deleted after their readouts were applied")
+messagesReleased = registry.counter("sqs_messages_released_total", "Messages made visible again after a failed apply")
+messagesDropped = registry.counter("sqs_messages_dropped_total", "Messages deleted without being applied (invalid or received too often)")
+visibilityExtensions = registry.counter("sqs_visibility_extensions_total", "Visibility timeout extensions for in-flight messages")
+inFlightMessages = registry.gauge("sqs_inflight_messages", "Messages received by the consumer pool but not yet deleted")
+
+def decodeBody(body):
+    '''
+    Decodes a base64 SQS message body into a list of readout dicts. A body
+    may hold a single readout or a batch published as a JSON list.
+    '''
+    readouts = json.loads(base64.b64decode(body))
+    return readouts if isinstance(readouts, list) else [readouts]
+
+def decodeBodies(bodies):
+    '''
+    Decodes many message bodies into readouts sorted by timestamp,
+    skipping malformed bodies and invalid readouts.
+    '''
+    readouts = []
+    for body in bodies:
+        try:
+            readouts += [readout for readout in decodeBody(body) if isValidReadout(readout)]
+        except ValueError:
+            pass
+    readouts.sort(key=lambda readout: readout.get('timestamp', 0))
+    return readouts
+
+def chunked(items, size=10):
+    # SQS batch calls take at most 10 entries
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class ConsumerPool(object):
+    '''
+    Several receiver threads long-polling the queue through the handler's
+    shared client. Readouts are buffered for mergeWindow seconds and handed
+    to onReadouts(readouts, receipts) sorted by timestamp. A message that
+    lands in a later window than newer readouts from the same clientId
+    arrives late; the GUI inserts late readouts in order rather than
+    dropping them.
+
+    Messages stay in flight, with their visibility timeout extended, until
+    acknowledge() deletes them; release() makes them visible again. A
+    message holding no valid readouts, or received more than maxReceives
+    times, is logged and deleted so it cannot stall the pool.
+    '''
+
+    def __init__(self, handler, onReadouts, receivers=4, visibilityTimeout=30, mergeWindow=0.5, waitSeconds=5, maxReceives=5):
+        self.logger = Logger("ConsumerPool")
+        self.handler = handler
+        self.onReadouts = onReadouts
+        self.receivers = receivers
+        self.visibilityTimeout = visibilityTimeout
+        self.mergeWindow = mergeWindow
+        self.waitSeconds = waitSeconds
+        self.maxReceives = maxReceives
+        self.running = False
+        self.lock = threading.Lock()
+        self.buffer = []  # (readouts, receiptHandle) received since the last merge
+        self.inFlight = {}  # receiptHandle -> when its visibility timeout was last set
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self.receive, name=f"sqs-receiver-{i}", daemon=True) for i in range(self.receivers)]
+        self.threads.append(threading.Thread(target=self.merge, name="sqs-merge", daemon=True))
+        self.threads.append(threading.Thread(target=self.maintain, name="sqs-maintain", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        self.logger.info(chalk.white("Started ") + chalk.blueBright(self.receivers) + chalk.white(" SQS receivers."))
+        return self
+
+    def stop(self):
+        # Receivers finish their current long poll on their own; anything
+        # they still hold becomes visible again after visibilityTimeout
+        self.running = False
+        for thread in self.threads[self.receivers:]:
+            thread.join(timeout=self.mergeWindow + 2)
+        self.flush()
+
+    def receive(self):
+        sqs = self.handler.client()
+        while self.running:
+            receiveCalls.inc()
+            try:
+                with receiveSeconds.time():
+                    response = sqs.receive_message(
+                        QueueUrl=self.handler.queue_url,
+                        AttributeNames=['ApproximateReceiveCount'],
+                        MaxNumberOfMessages=10,
+                        VisibilityTimeout=self.visibilityTimeout,
+                        WaitTimeSeconds=self.waitSeconds
+                    )
+            except Exception as e:
+                self.logger.warn(f"Receive failed: {e}")
+                time.sleep(1)
+                continue
+            messages = response.get('Messages', [])
+            if not messages:
+                continue
+            messagesReceived.inc(len(messages))
+            batch = []
+            for message in messages:
+                receives = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+                if receives > self.maxReceives:
+                    self.drop(message, f"failed to apply after {receives - 1} deliveries")
+                    continue
+                try:
+                    decoded = decodeBody(message['Body'])
+                except (KeyError, ValueError):
+                    decoded = []
+                readouts = [readout for readout in decoded if isValidReadout(readout)]
+                if not readouts:
+                    # Nothing to apply, so delete it rather than redeliver it forever
+                    self.drop(message, "no valid readouts")
+                    continue
+                if len(readouts) < len(decoded):
+                    self.logger.warn(f"Skipping {len(decoded) - len(readouts)} invalid readouts in message: {message}")
+                record("sqs", readouts)
+                batch.append((readouts, message['ReceiptHandle']))
+            now = time.monotonic()
+            with self.lock:
+                for readouts, receipt in batch:
+                    self.inFlight[receipt] = now
+                self.buffer += batch
+                inFlightMessages.set(len(self.inFlight))
+
+    def drop(self, message, reason):
+        self.logger.error(f"Dropping message ({reason}): {message}")
+        messagesDropped.inc()
+        self.handler.acknowledge([message['ReceiptHandle']])
+
+    def merge(self):
+        while self.running:
+            time.sleep(self.mergeWindow)
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if not batch:
+                continue
+            receipts = [receipt for readoutList, receipt in batch]
+            # One bad window must not end the thread, or nothing is applied again
+            try:
+                readouts = [readout for readoutList, receipt in batch for readout in readoutList]
+                readouts.sort(key=lambda readout: readout.get('timestamp', 0))
+                self.onReadouts(readouts, receipts)
+            except Exception as e:
+                self.logger.error(f"Failed to deliver {len(receipts)} messages, releasing them: {e}")
+                self.release(receipts)
+
+    def acknowledge(self, receipts):
+        '''
+        Marks messages as applied; they are deleted from the queue shortly.
+        '''
+        with self.lock:
+            for receipt in receipts:
+                self.inFlight.pop(receipt, None)
+        self.handler.acknowledge(receipts)
+
+    def release(self, receipts):
+        '''
+        Returns messages that could not be applied to the queue for redelivery.
+        '''
+        with self.lock:
+            for receipt in receipts:
+                self.inFlight.pop(receipt, None)
+        self.handler.release(receipts)
+
+    def maintain(self):
+        while self.running:
+            time.sleep(1)
+            self.flush()
+            self.extend()
+
+    def flush(self):
+        self.handler.flush()
+        with self.lock:
+            inFlightMessages.set(len(self.inFlight))
+
+    def extend(self):
+        # Pushes back the timeout of messages halfway to becoming visible again
+        now = time.monotonic()
+        with self.lock:
+            due = [receipt for receipt, since in self.inFlight.items() if now - since >= self.visibilityTimeout / 2]
+            for receipt in due:
+                self.inFlight[receipt] = now
+        sqs = self.handler.client()
+        for chunk in chunked(due):
+            try:
+                sqs.change_message_visibility_batch(
+                    QueueUrl=self.handler.queue_url,
+                    Entries=[{'Id': str(i), 'ReceiptHandle': receipt, 'VisibilityTimeout': self.visibilityTimeout} for i, receipt in enumerate(chunk)]
+                )
+                visibilityExtensions.inc(len(chunk))
+            except Exception as e:
+                self.logger.warn(f"Could not extend visibility of {len(chunk)} messages: {e}")
+
 class SQSHandler(threading.Thread):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, client=None, **kwargs):
         self.logger = Logger("SQSHandler")
         self.queue_url = device["sqsUrl"]
+        self.sqs = client  # Injectable for tests and benchmarks; created on first use otherwise
+        self.clientLock = threading.Lock()
+
+        # Backlog catch-up settings, e.g. {"threshold": 50, "receivers": 4}
+        catchUp = device.get("catchUp", {})
+        self.catchUpThreshold = catchUp.get("threshold", 50)
+        self.catchUpReceivers = catchUp.get("receivers", 4)
+        self.catchUpCheckInterval = catchUp.get("checkInterval", 60)
+        # Drained messages stay hidden until the GUI has applied them
+        self.catchUpVisibilityTimeout = catchUp.get("visibilityTimeout", 300)
+        # Room for every receiver thread plus deletes and visibility changes
+        receivers = max(self.catchUpReceivers, device.get("consumerPool", {}).get("receivers", 4))
+        self.maxPoolConnections = receivers + 2
+        self.lastDepthCheck = None
+        self.acknowledged = queue.Queue()  # Receipts of applied messages, deleted by flush()
+        self.released = queue.Queue()  # Receipts of messages to redeliver, made visible by flush()
+
+    def client(self):
+        # One SQS client (and connection pool) shared by every receiver thread
+        with self.clientLock:
+            if self.sqs is None:
+                session = boto3.session.Session()
+                self.sqs = session.client('sqs', config=Config(max_pool_connections=self.maxPoolConnections))
+            return self.sqs
    
+    def acknowledge(self, receipts):
+        '''
+        Marks messages as applied; flush() deletes them from the queue.
+        '''
+        for receipt in receipts:
+            self.acknowledged.put(receipt)
+
+    def release(self, receipts):
+        '''
+        Marks messages that could not be applied; flush() makes them
+        visible again for redelivery.
+        '''
+        for receipt in receipts:
+            self.released.put(receipt)
+
+    def flush(self):
+        # Deletes acknowledged messages and releases failed ones in batches of 10
+        sqs = self.client()
+        for pending, apply in ((self.acknowledged, self.delete), (self.released, self.makeVisible)):
+            receipts = []
+            while not pending.empty():
+                receipts.append(pending.get())
+            for chunk in chunked(receipts):
+                try:
+                    apply(sqs, chunk)
+                except Exception as e:
+                    self.logger.warn(f"Could not update {len(chunk)} messages: {e}")
+
+    def delete(self, sqs, receipts):
+        response = sqs.delete_message_batch(
+            QueueUrl=self.queue_url,
+            Entries=[{'Id': str(i), 'ReceiptHandle': receipt} for i, receipt in enumerate(receipts)]
+        )
+        failed = response.get('Failed', [])
+        messagesDeleted.inc(len(receipts) - len(failed))
+        if failed:
+            self.logger.warn(f"Failed to delete {len(failed)} messages: {failed}")
+
+    def makeVisible(self, sqs, receipts):
+        sqs.change_message_visibility_batch(
+            QueueUrl=self.queue_url,
+            Entries=[{'Id': str(i), 'ReceiptHandle': receipt, 'VisibilityTimeout': 0} for i, receipt in enumerate(receipts)]
+        )
+        messagesReleased.inc(len(receipts))
+
+    def startConsumers(self, onReadouts):
+        '''
+        Starts a ConsumerPool configured by the "consumerPool" key in
+        device.json, e.g. {"receivers": 4, "visibilityTimeout": 30,
+        "mergeWindow": 0.5, "maxReceives": 5}.
+        '''
+        settings = device.get("consumerPool", {})
+        return ConsumerPool(
+            self,
+            onReadouts,
+            receivers=settings.get("receivers", 4),
+            visibilityTimeout=settings.get("visibilityTimeout", 30),
+            mergeWindow=settings.get("mergeWindow", 0.5),
+            waitSeconds=settings.get("waitSeconds", 5),
+            maxReceives=settings.get("maxReceives", 5)
+        ).start()
+
     def getMessage(self):
-        # Create session & SQS client
-        session = boto3.session.Session()
-        sqs = session.client('sqs')
+        sqs = self.client()
         
         # Check for messages & grab latest 1
-        response = sqs.receive_message(
-            QueueUrl=self.queue_url,
-            AttributeNames=[
-                'SentTimeStamp'
-            ],
-            MaxNumberOfMessages=1,
-            MessageAttributeNames=[
-                'All'
-            ],
-            VisibilityTimeout=0,
-            WaitTimeSeconds=5
-        )
+        receiveCalls.inc()
+        with receiveSeconds.time():
+            response = sqs.receive_message(
+                QueueUrl=self.queue_url,
+                AttributeNames=[
+                    'SentTimeStamp'
+                ],
+                MaxNumberOfMessages=1,
+                MessageAttributeNames=[
+                    'All'
+                ],
+                VisibilityTimeout=0,
+                WaitTimeSeconds=5
+            )
         
         if 'Messages' in response:
+            messagesReceived.inc()
             # Handle messsage * clear from queue when received
             message = response['Messages'][0]
             if 'Body' in message:
                 body = base64.b64decode(message['Body'])
+                record("sqs", body)
 
             receipt_handle = message['ReceiptHandle']
 
@@ -51,3 +347,68 @@ class SQSHandler(threading.Thread):
             # Report when no messages are available
             self.logger.info('No messages in queue.')
             return None
+
+    def getQueueDepth(self):
+        response = self.client().get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=['ApproximateNumberOfMessages']
+        )
+        return int(response['Attributes']['ApproximateNumberOfMessages'])
+
+    def isBacklogged(self):
+        '''
+        Checks the queue depth at most every catchUpCheckInterval seconds and
+        reports whether it is deep enough to switch to catch-up mode.
+        '''
+        now = time.monotonic()
+        if self.lastDepthCheck is not None and now - self.lastDepthCheck < self.catchUpCheckInterval:
+            return False
+        self.lastDepthCheck = now
+        depth = self.getQueueDepth()
+        self.logger.info(f"Approximate queue depth: {depth}")
+        return depth >= self.catchUpThreshold
+
+    def receiveBatch(self):
+        # Receive up to 10 messages; they stay hidden until acknowledged or released
+        sqs = self.client()
+        receiveCalls.inc()
+        with receiveSeconds.time():
+            response = sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=10,
+                VisibilityTimeout=self.catchUpVisibilityTimeout,
+                WaitTimeSeconds=1
+            )
+        messages = response.get('Messages', [])
+        if messages:
+            messagesReceived.inc(len(messages))
+        for message in messages:
+            if 'Body' in message:
+                record("sqs", base64.b64decode(message['Body']))
+        return messages
+
+    def drainBacklog(self):
+        '''
+        Drains the queue with several parallel receivers and returns the
+        decoded readouts in timestamp order with the receipts of every
+        drained message. Nothing is deleted until the receipts are
+        acknowledged, which the caller does once the readouts are applied.
+        '''
+        start = time.perf_counter()
+
+        def receiver():
+            messages = []
+            batch = self.receiveBatch()
+            while batch:
+                messages += batch
+                batch = self.receiveBatch()
+            return messages
+
+        with ThreadPoolExecutor(max_workers=self.catchUpReceivers) as pool:
+            futures = [pool.submit(receiver) for i in range(self.catchUpReceivers)]
+            messages = [message for future in futures for message in future.result()]
+        readouts = decodeBodies([message['Body'] for message in messages if 'Body' in message])
+        catchUpRuns.inc()
+        catchUpMessages.inc(len(messages))
+        self.logger.info(chalk.white("Caught up on ") + chalk.blueBright(len(messages)) + chalk.white(f" messages ({len(readouts)} readouts) in {time.perf_counter() - start:.2f}s."))
+        return readouts, [message['ReceiptHandle'] for message in messages]
@@ -0,0 +1,217 @@
+import threading, time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+# Default latency buckets (seconds) for histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+    def summary(self):
+        return f"{self.value}"
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+    def summary(self):
+        return f"{self.value}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        # Observes the wall time spent inside the with-block
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        samples = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            samples.append((f"{self.name}_bucket", f'{{le="{bound}"}}', cumulative))
+        samples.append((f"{self.name}_bucket", '{le="+Inf"}', count))
+        samples.append((f"{self.name}_sum", "", total))
+        samples.append((f"{self.name}_count", "", count))
+        return samples
+
+    def summary(self):
+        if self.count == 0:
+            return "n=0"
+        return f"n={self.count} avg={self.sum / self.count * 1000:.2f}ms"
+
+class MetricsRegistry:
+    '''
+    In-process registry of counters, gauges and fixed-bucket histograms.
+    Metrics are created on first use and shared by name, so modules can
+    declare the metrics they update at import time.
+    '''
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def __getOrCreate(self, cls, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help=""):
+        return self.__getOrCreate(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self.__getOrCreate(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self.__getOrCreate(Histogram, name, help, buckets)
+
+    def render(self):
+        '''
+        Returns every registered metric in the Prometheus text exposition
+        format.
+        '''
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        return " ".join(f"{metric.name}={metric.summary()}" for metric in list(self.metrics.values()))
+
+# Shared registry used by the data server and the GUI
+registry = MetricsRegistry()
+
+class MetricsServer(threading.Thread):
+    '''
+    Serves the registry over HTTP on localhost at /metrics.
+    '''
+
+    def __init__(self, port, host="127.0.0.1", metrics=registry):
+        super(MetricsServer, self).__init__(daemon=True)
+        self.logger = Logger("Metrics")
+        metricsRegistry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metricsRegistry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, int(port)), Handler)
+        self.logger.info(chalk.white("Serving metrics at ") + chalk.blueBright(f"http://{host}:{self.httpd.server_address[1]}/metrics"))
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class MetricsReporter(threading.Thread):
+    '''
+    Logs a one-line summary of the registry every interval seconds.
+    '''
+
+    def __init__(self, interval, metrics=registry):
+        super(MetricsReporter, self).__init__(daemon=True)
+        self.logger = Logger("Metrics")
+        self.interval = float(interval)
+        self.metrics = metrics
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.logger.info(chalk.white("Metrics summary") + self.logger.sep + chalk.blueBright(self.metrics.summary()))
+
+    def stop(self):
+        self.stopped.set()
+
+def startMetrics(port=None, logInterval=None):
+    '''
+    Starts the optional HTTP endpoint and/or periodic log summary. Either
+    one is skipped when its setting is None.
+    '''
+    started = []
+    if port is not None:
+        server = MetricsServer(port)
+        server.start()
+        started.append(server)
+    if logInterval is not None:
+        reporter = MetricsReporter(logInterval)
+        reporter.start()
+        started.append(reporter)
+    return started
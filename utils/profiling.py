@@ -0,0 +1,133 @@
+import cProfile, functools, marshal, os, sys, threading, tracemalloc
+
+from simple_chalk import chalk
+from utils.custom_logging import Logger
+
+# Profiling is switched on with the AHT20_PROFILE environment variable or a
+# --profile command line flag, so production units can be profiled without
+# code changes. Stats files are written to AHT20_PROFILE_DIR every
+# AHT20_PROFILE_INTERVAL seconds.
+enabled = os.environ.get("AHT20_PROFILE", "") not in ("", "0") or "--profile" in sys.argv
+outputDir = os.environ.get("AHT20_PROFILE_DIR", "./profiles")
+dumpInterval = float(os.environ.get("AHT20_PROFILE_INTERVAL", 60))
+
+profiles = {}
+profilesLock = threading.Lock()
+local = threading.local()
+logger = None
+
+def getLogger():
+    global logger
+    if logger is None:
+        logger = Logger("Profiler")
+    return logger
+
+def trace(msg):
+    '''
+    Logs a diagnostic message only when profiling is enabled.
+    '''
+    if enabled:
+        getLogger().debug(msg)
+
+def profiled(name):
+    '''
+    Decorator that runs the wrapped function under cProfile when profiling
+    is enabled and returns the function untouched otherwise. Each thread
+    gets its own profile per name; nested profiled calls on the same thread
+    are captured by the outermost profile.
+    '''
+    def decorator(fn):
+        if not enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if getattr(local, "active", False):
+                return fn(*args, **kwargs)
+            key = (name, threading.current_thread().name)
+            with profilesLock:
+                if key not in profiles:
+                    profiles[key] = cProfile.Profile()
+                profile = profiles[key]
+            local.active = True
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                local.active = False
+        return wrapper
+    return decorator
+
+def currentRss():
+    '''
+    Returns the resident set size of this process in bytes.
+    '''
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Fall back to peak RSS where /proc is unavailable (macOS reports bytes)
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+class ProfileDumper(threading.Thread):
+    '''
+    Periodically writes cProfile stats and tracemalloc snapshots to the
+    profile output directory and logs the largest allocation growth since
+    the previous snapshot.
+    '''
+
+    def __init__(self, prefix, interval=dumpInterval, directory=outputDir):
+        super(ProfileDumper, self).__init__(daemon=True)
+        self.logger = getLogger()
+        self.prefix = prefix
+        self.interval = interval
+        self.directory = directory
+        self.stopped = threading.Event()
+        self.lastSnapshot = None
+        self.count = 0
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        self.stopped.set()
+        self.dump()
+
+    def dump(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with profilesLock:
+            items = list(profiles.items())
+        for (name, threadName), profile in items:
+            # snapshot_stats reads the running profile without disabling it
+            profile.snapshot_stats()
+            path = os.path.join(self.directory, f"{self.prefix}-{name}-{threadName}.prof")
+            with open(path, "wb") as out:
+                marshal.dump(profile.stats, out)
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            snapshot.dump(os.path.join(self.directory, f"{self.prefix}-{self.count:04d}.tracemalloc"))
+            if self.lastSnapshot is not None:
+                for stat in snapshot.compare_to(self.lastSnapshot, "lineno")[:5]:
+                    self.logger.info(chalk.white("Allocation growth") + self.logger.sep + chalk.blueBright(stat))
+            self.lastSnapshot = snapshot
+
+        self.count += 1
+        self.logger.info(chalk.white("Profile stats written to ") + chalk.blueBright(self.directory) + self.logger.sep + chalk.white(f"RSS {currentRss() / 1048576:.1f} MiB"))
+
+def startProfiling(prefix):
+    '''
+    Starts tracemalloc and the periodic stats dumper when profiling is
+    enabled. Returns the dumper, or None when profiling is off.
+    '''
+    if not enabled:
+        return None
+    tracemalloc.start(10)
+    dumper = ProfileDumper(prefix)
+    dumper.start()
+    getLogger().info(chalk.yellowBright("Profiling enabled") + getLogger().sep + chalk.white(f"dumping every {dumper.interval:g}s to {dumper.directory}"))
+    return dumper
@@ -5,6 +5,8 @@ from PyQt5.QtCore import *
 import time
 import traceback, sys
 
+from utils.profiling import profiled, trace
+
 # Adapted from https://www.pythonguis.com/tutorials/multithreading-pyqt-applications-qthreadpool/
 class WorkerSignals(QObject):
     """
@@ -25,7 +27,6 @@ class WorkerSignals(QObject):
         int indicating % progress
 
     """
-    print("WorkerSignals instantiated.")
     finished = pyqtSignal()
     error = pyqtSignal(tuple)
     result = pyqtSignal(object)
@@ -49,7 +50,7 @@ class Worker (QRunnable):
     def __init__(self, fn, *args, **kwargs):
         super(Worker, self).__init__()
 
-        print("--- Worker initializing")
+        trace("--- Worker initializing")
         # Store constructor arguments (re-used for processing)
         self.fn = fn
         self.args = args
@@ -60,24 +61,25 @@ class Worker (QRunnable):
         self.kwargs['progressCallback'] = self.signals.progress
 
     @pyqtSlot()
+    @profiled("Worker.run")
     def run(self):
         """
         Initialise the runner funtion with passed args, kwargs.
         """
 
-        print("--- Worker.run started")
+        trace("--- Worker.run started")
         # Retrieve args/kwargs here; and fire processing using them
         try:
-            print(f"Worker trying to call {self.fn}")
+            trace(f"Worker trying to call {self.fn}")
             result = self.fn(*self.args,**self.kwargs)
         except:
-            print("Worker exception encountered")
+            trace("Worker exception encountered")
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
             self.signals.error.emit((exctype, value, traceback.format_exc()))
         else:
-            print(f"Worker emitting result :: {result}")
+            trace(f"Worker emitting result :: {result}")
             self.signals.result.emit(result) # Return the result of the processing
         finally:
-            print(f"Worker done, emitting finished signal")
+            trace("Worker done, emitting finished signal")
             self.signals.finished.emit() # Done